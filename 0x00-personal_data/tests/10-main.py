@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""
+Main file
+"""
+
+get_logger = __import__('filtered_logger').get_logger
+
+logger = get_logger(asynchronous=True)
+logger = get_logger(asynchronous=True)
+print("handlers: {}".format(len(logger.handlers)))
+
+for i in range(3):
+    logger.info("name=Bob{0};email=bob{0}@dylan.com;ip=10.0.0.{0};".format(i))
+
+queue_handler = logger.handlers[0]
+queue_handler.listener.stop()
+print("dropped: {}".format(queue_handler.dropped))
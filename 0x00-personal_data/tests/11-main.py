@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Main file: RedactingFormatter throughput, regex path vs mapping path
+"""
+import logging
+import sys
+import time
+
+RedactingFormatter = __import__('filtered_logger').RedactingFormatter
+PII_FIELDS = __import__('filtered_logger').PII_FIELDS
+
+n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+names = ["name", "email", "phone", "ssn", "password", "ip", "last_login",
+         "user_agent"]
+rows = [("user{}".format(i), "user{}@example.com".format(i),
+         "(555) 01-{:04d}".format(i % 10000), "000-00-0000",
+         "pwd{}".format(i), "10.0.0.{}".format(i % 256),
+         "2019-11-14 06:14:24", "Mozilla/5.0") for i in range(n_rows)]
+template = ' '.join('{0}=%({0})s;'.format(name) for name in names)
+
+for label in ("regex", "mapping"):
+    formatter = RedactingFormatter(list(PII_FIELDS))
+    start = time.perf_counter()
+    for row in rows:
+        if label == "regex":
+            msg = ''.join('{}={}; '.format(f, r)
+                          for r, f in zip(row, names)).strip()
+            args = None
+        else:
+            msg, args = template, (dict(zip(names, row)),)
+        record = logging.LogRecord("user_data", logging.INFO, None, None,
+                                   msg, args, None)
+        formatter.format(record)
+    elapsed = time.perf_counter() - start
+    print("{}: {} records in {:.2f}s, {:.0f} records/sec, "
+          "{} bytes redacted".format(label, n_rows, elapsed,
+                                     n_rows / elapsed,
+                                     formatter.bytes_redacted))
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Main file
+"""
+
+hash_many = __import__('encrypt_password').hash_many
+verify_many = __import__('encrypt_password').verify_many
+
+passwords = ["password{}".format(i) for i in range(2000)]
+
+stats = {}
+hashes = list(hash_many(passwords, rounds=4, stats=stats))
+print("hashed {items} in {seconds:.2f}s, {items_per_sec:.0f}/sec".format(
+    **stats))
+
+pairs = ((hashed, password if i % 100 else "wrong")
+         for i, (hashed, password) in enumerate(zip(hashes, passwords)))
+stats = {}
+results = list(verify_many(pairs, stats=stats))
+print("verified {items} in {seconds:.2f}s, {items_per_sec:.0f}/sec".format(
+    **stats))
+print("invalid: {}".format(results.count(False)))
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Main file: redaction of records whose args are a mapping
+"""
+import logging
+
+RedactingFormatter = __import__('filtered_logger').RedactingFormatter
+
+formatter = RedactingFormatter(["name", "password"])
+cases = [
+    ("login name=%(n)s; password=hunter2;", {"n": "Bob"}),
+    ("name=%(name)s; password=%(password)s;",
+     {"name": "Bob", "password": "hunter2"}),
+    ("name=%(name)s; ip=%(ip)s; 100%%", {"name": "Bob", "ip": "10.0.0.1"}),
+    ("%(key)s=%(value)s;", {"key": "password", "value": "hunter2"}),
+    ("note=%(note)s", {"note": "name=Bob; password=hunter2;"}),
+    ("user %(who)r password=50%%hunter2;", {"who": {"name=Bob;": 1}}),
+]
+for msg, args in cases:
+    record = logging.LogRecord("user_data", logging.INFO, None, None,
+                               msg, (args,), None)
+    line = formatter.format(record)
+    print(line.split(": ", 1)[1])
+    assert "Bob" not in line and "hunter2" not in line
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Main file: bcrypt cost calibration and rehash checks
+"""
+import os
+
+encrypt_password = __import__('encrypt_password')
+calibrate_rounds = encrypt_password.calibrate_rounds
+current_rounds = encrypt_password.current_rounds
+hash_password = encrypt_password.hash_password
+is_valid = encrypt_password.is_valid
+needs_rehash = encrypt_password.needs_rehash
+
+rounds = calibrate_rounds()
+print(encrypt_password.MIN_ROUNDS <= rounds <= encrypt_password.MAX_ROUNDS)
+print(calibrate_rounds(1) == encrypt_password.MIN_ROUNDS)
+print(calibrate_rounds(10 ** 9) == encrypt_password.MAX_ROUNDS)
+print(calibrate_rounds(50) <= calibrate_rounds(5000))
+
+os.environ["BCRYPT_ROUNDS"] = "5"
+print(current_rounds())
+
+current = hash_password("MyPwd")
+older = hash_password("MyPwd", 4)
+print(needs_rehash(current), needs_rehash(older),
+      needs_rehash(current.decode()), needs_rehash(b"not a hash"))
+print(is_valid(current, "MyPwd", check_rehash=True))
+print(is_valid(older, "MyPwd", check_rehash=True))
+print(is_valid(older, "WrongPwd", check_rehash=True))
+print(is_valid(current, "MyPwd"), is_valid(older, "WrongPwd"))
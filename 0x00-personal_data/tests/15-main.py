@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Main file: batched export goes where logger.info would, honouring the
+logger's filters and the handlers' error handling
+"""
+import io
+import logging
+
+filtered_logger = __import__('filtered_logger')
+
+stream = io.StringIO()
+handler = logging.StreamHandler(stream)
+handler.setFormatter(filtered_logger.RedactingFormatter(["email"]))
+logger = logging.getLogger("export_filter")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+logger.addHandler(handler)
+logger.addFilter(lambda record: record.args["name"] != "skip")
+
+rows = [("bob", "bob@dylan.com"), ("skip", "skip@me.com"),
+        ("egg", "egg@min.com")]
+filtered_logger._emit_batch(logger, "name=%(name)s; email=%(email)s;",
+                            ["name", "email"], rows)
+for line in stream.getvalue().splitlines():
+    print(line.split(": ", 1)[1])
+
+print("-- propagated to the parent's handler")
+stream.seek(0)
+stream.truncate()
+child = logging.getLogger("export_filter.child")
+filtered_logger._emit_batch(child, "name=%(name)s; email=%(email)s;",
+                            ["name", "email"], rows)
+for line in stream.getvalue().splitlines():
+    print(line.split(": ", 1)[1])
+
+print("-- a record failing to format")
+
+
+class Recording(logging.StreamHandler):
+    """ Stream handler keeping the records it failed on """
+    failed = []
+
+    def handleError(self, record: logging.LogRecord):
+        self.failed.append(record.args)
+
+
+stream.seek(0)
+stream.truncate()
+handler.__class__ = Recording
+filtered_logger._emit_batch(logger, "name=%(name)s; age=%(age)d;",
+                            ["name", "age"], [("bob", 42), ("egg", "n/a")])
+for line in stream.getvalue().splitlines():
+    print(line.split(": ", 1)[1])
+print("handleError: {}".format(Recording.failed))
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Main file: filter_datum throughput, per-field passes vs single pass
+"""
+import re
+import sys
+import time
+
+filter_datum = __import__('filtered_logger').filter_datum
+PII_FIELDS = __import__('filtered_logger').PII_FIELDS
+
+
+def legacy_filter_datum(fields, redaction, message, separator):
+    """ One re.sub per field, pattern rebuilt on every call """
+    for field in fields:
+        message = re.sub(r'{}=.*?{}'.format(field, separator),
+                         '{}={}{}'.format(field, redaction, separator),
+                         message)
+    return message
+
+
+n_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+lines = ["name=user{0};email=user{0}@example.com;phone=(555) 01-{0:04d};"
+         "ssn={0:03d}-00-0000;password=pwd{0};ip=10.0.0.{1};"
+         "last_login=2019-11-14 06:14:24;user_agent=Mozilla/5.0;"
+         .format(i, i % 256) for i in range(n_lines)]
+
+results = {}
+for label, func in (("before", legacy_filter_datum),
+                    ("after", filter_datum)):
+    start = time.perf_counter()
+    redacted = [func(PII_FIELDS, '***', line, ';') for line in lines]
+    elapsed = time.perf_counter() - start
+    results[label] = redacted
+    print("{}: {} lines in {:.2f}s, {:.0f} lines/sec".format(
+        label, n_lines, elapsed, n_lines / elapsed))
+
+print("identical output: {}".format(results["before"] == results["after"]))
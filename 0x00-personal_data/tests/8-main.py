@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Main file
+"""
+
+import logging
+
+RedactingFormatter = __import__('filtered_logger').RedactingFormatter
+
+message = "name=Bob;email=bob@dylan.com;ssn=000-123-0000;password=bobby2019;"
+formatter = RedactingFormatter(fields=("email", "ssn", "password"))
+
+for i in range(3):
+    log_record = logging.LogRecord("my_logger", logging.INFO, None, None,
+                                   message, None, None)
+    print(formatter.format(log_record))
+print("records: {}, bytes redacted: {}".format(formatter.records_formatted,
+                                               formatter.bytes_redacted))
+
+formatter.REDACTION = "xxx"
+formatter.fields = ["name"]
+log_record = logging.LogRecord("my_logger", logging.INFO, None, None,
+                               message, None, None)
+print(formatter.format(log_record))
+print("records: {}, bytes redacted: {}".format(formatter.records_formatted,
+                                               formatter.bytes_redacted))
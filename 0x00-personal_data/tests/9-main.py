@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Main file: ConnectionPool with SQLite standing in for MySQL
+"""
+
+import sqlite3
+import threading
+import time
+
+ConnectionPool = __import__('filtered_logger').ConnectionPool
+
+opened = []
+
+
+def connect():
+    """ Opens an in-memory SQLite connection and records it """
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    opened.append(connection)
+    return connection
+
+
+pool = ConnectionPool(connect, size=2, idle_timeout=0.1)
+
+with pool.connection() as db:
+    print(db.execute("SELECT 1;").fetchone()[0])
+with pool.connection() as db_again:
+    print("reused: {}".format(db_again is db))
+
+first = pool.acquire()
+second = pool.acquire()
+print("opened: {}".format(len(opened)))
+try:
+    pool.acquire(timeout=0.1)
+except TimeoutError as err:
+    print("exhausted: {}".format(err))
+
+
+def steal(stop):
+    """ Wakes waiters as a release taken by another thread would """
+    while not stop.wait(0.05):
+        with pool._cond:
+            pool._cond.notify_all()
+
+
+stop = threading.Event()
+thief = threading.Thread(target=steal, args=(stop,))
+thief.start()
+start = time.monotonic()
+try:
+    pool.acquire(timeout=0.2)
+except TimeoutError:
+    print("woken and timed out within the timeout: {}".format(
+        time.monotonic() - start < 0.4))
+stop.set()
+thief.join()
+pool.release(first)
+pool.release(second)
+
+time.sleep(0.2)
+with pool.connection() as db:
+    print("after idle timeout, new connection: {}".format(
+        db is not first and db is not second))
+print("opened: {}".format(len(opened)))
+pool.close()
+
+pool = ConnectionPool(connect, size=1)
+try:
+    with pool.connection() as broken:
+        raise sqlite3.OperationalError("server has gone away")
+except sqlite3.OperationalError:
+    pass
+with pool.connection() as db:
+    print("after an error, new connection: {}".format(db is not broken))
+    db.execute("CREATE TABLE t (x INTEGER);")
+    db.execute("INSERT INTO t VALUES (1);")
+with pool.connection() as db_again:
+    print("open transaction rolled back: {}".format(
+        db_again.in_transaction is False))
+pool.close()
@@ -0,0 +1,1075 @@
+#!/usr/bin/env python3
+""" File storage module: objects in memory, persisted to .db_* files
+"""
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, TypeVar, Iterator, List
+from os import getenv, path
+import atexit
+import bisect
+import fcntl
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+import zlib
+from models import binary_snapshot
+from models.storage import Storage
+
+
+JOURNAL_COMPACT_EVERY = int(getenv("DB_JOURNAL_COMPACT_EVERY", 1000))
+SHARED = getenv("DB_SHARED", "0") == "1"
+WRITE_BEHIND = getenv("DB_WRITE_BEHIND", "0") == "1" and not SHARED
+FLUSH_INTERVAL_MS = int(getenv("DB_FLUSH_INTERVAL_MS", 100))
+FLUSH_EVERY = int(getenv("DB_FLUSH_EVERY", 100))
+LAZY = getenv("DB_LAZY", "0") == "1"
+LAZY_CACHE_SIZE = int(getenv("DB_LAZY_CACHE_SIZE", 10000))
+ITERATE_BATCH = 500
+RELEASE_EVERY = 1 << 23
+FORMAT = getenv("DB_FORMAT", "jsonl" if LAZY else "json")
+SHARDS = int(getenv("DB_SHARDS", 1))
+SNAPSHOT_FORMATS = ("json", "jsonl", "bin")
+FSYNC = getenv("DB_FSYNC", "interval")
+FSYNC_INTERVAL_MS = int(getenv("DB_FSYNC_INTERVAL_MS", 1000))
+DATA = {}
+INDEXES = {}
+INDEXED_VALUES = {}
+JOURNAL_SIZES = {}
+SORTED_IDS = {}
+ID_GENERATIONS = {}
+DIRTY = {}
+LOCKS = {}
+UNSYNCED = set()
+SEEN = {}
+GENERATIONS = {}
+FILE_LOCKS = {}
+_locks_lock = threading.Lock()
+_ids_lock = threading.Lock()
+_dirty_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_wanted = threading.Event()
+_flusher = None
+_unsynced_lock = threading.Lock()
+_syncer = None
+logger = logging.getLogger(__name__)
+
+
+class ReadWriteLock():
+    """ Many readers or one writer, writers first
+
+    The writing thread may take the lock again, for reading or writing.
+    """
+
+    def __init__(self):
+        """ Initialize an unlocked lock
+        """
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        """ Hold the lock shared for a `with` block
+        """
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        """ Hold the lock exclusively for a `with` block
+        """
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                self._waiting_writers += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._waiting_writers -= 1
+                self._writer = me
+            self._writes += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writes -= 1
+                if self._writes == 0:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+def _lock(s_class: str) -> ReadWriteLock:
+    """ Return the lock guarding one class's objects and indexes
+    """
+    lock = LOCKS.get(s_class)
+    if lock is None:
+        with _locks_lock:
+            lock = LOCKS.setdefault(s_class, ReadWriteLock())
+    return lock
+
+
+class LazyStore(MutableMapping):
+    """ Objects of one class, materialized from a snapshot on demand
+
+    The line-delimited snapshot is memory-mapped and only an id -> line
+    offset index is built when it is opened; the pages read through to
+    build it, or to copy the snapshot, are handed back as it goes, every
+    RELEASE_EVERY bytes, rather than kept resident. An object is built on first
+    access and kept in a bounded LRU cache; objects stored afterwards are
+    held in memory until the next snapshot, which the journal forces once
+    there are DB_LAZY_CACHE_SIZE of them.
+    """
+
+    def __init__(self, cls, file_path: str, offsets: dict = None):
+        """ Open the snapshot of `cls` at `file_path`, indexing its lines
+        unless their `offsets` are known already
+        """
+        self._cls = cls
+        self._offsets = {}
+        self._changed = {}
+        self._cache = OrderedDict()
+        self._mmap = None
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if offsets is not None:
+            self._offsets = offsets
+            return
+        prefix = b'{"id": "'
+        start, end, released = 0, len(self._mmap), 0
+        while start < end:
+            stop = self._mmap.find(b'\n', start)
+            if stop == -1:
+                stop = end
+            id_start = start + len(prefix)
+            if self._mmap[start:id_start] == prefix:
+                id_stop = self._mmap.find(b'"', id_start)
+                obj_id = self._mmap[id_start:id_stop].decode()
+            else:
+                obj_id = json.loads(self._mmap[start:stop])['id']
+            self._offsets[obj_id] = (start, stop)
+            start = stop + 1
+            if start - released >= RELEASE_EVERY:
+                released = self._release(start)
+
+    def _release(self, stop: int) -> int:
+        """ Drop the pages of the snapshot before byte `stop` from memory;
+        they are read back from the file if needed again
+        """
+        stop -= stop % mmap.PAGESIZE
+        if hasattr(mmap, 'MADV_DONTNEED'):
+            self._mmap.madvise(mmap.MADV_DONTNEED, 0, stop)
+        return stop
+
+    def _raw(self, obj_id: str) -> dict:
+        """ Parse the snapshot line of an object
+        """
+        start, stop = self._offsets[obj_id]
+        return json.loads(self._mmap[start:stop])
+
+    def __getitem__(self, obj_id: str) -> TypeVar('Base'):
+        """ Return an object, building it from the snapshot if needed
+        """
+        obj = self._changed.get(obj_id)
+        if obj is not None:
+            return obj
+        obj = self._cache.get(obj_id)
+        if obj is not None:
+            self._cache.move_to_end(obj_id)
+            return obj
+        obj = self._cls(**self._raw(obj_id))
+        self._cache[obj_id] = obj
+        if len(self._cache) > LAZY_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return obj
+
+    def __setitem__(self, obj_id: str, obj: TypeVar('Base')):
+        """ Store an object in memory, shadowing its snapshot line
+        """
+        self._offsets.pop(obj_id, None)
+        self._cache.pop(obj_id, None)
+        self._changed[obj_id] = obj
+
+    def __delitem__(self, obj_id: str):
+        """ Forget an object
+        """
+        found = self._changed.pop(obj_id, None) is not None
+        found = self._offsets.pop(obj_id, None) is not None or found
+        self._cache.pop(obj_id, None)
+        if not found:
+            raise KeyError(obj_id)
+
+    def __contains__(self, obj_id) -> bool:
+        """ Tell whether an object exists, without building it
+        """
+        return obj_id in self._changed or obj_id in self._offsets
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over object ids
+        """
+        yield from list(self._offsets)
+        yield from list(self._changed)
+
+    def __len__(self) -> int:
+        """ Number of objects
+        """
+        return len(self._offsets) + len(self._changed)
+
+    def changed_count(self) -> int:
+        """ Number of objects stored since the snapshot
+        """
+        return len(self._changed)
+
+    def reopen(self, file_path: str, offsets: dict) -> 'LazyStore':
+        """ Open the new snapshot these objects were written to, at line
+        `offsets`, keeping the objects stored since the old one cached
+        """
+        store = LazyStore(self._cls, file_path, offsets)
+        for obj_id, obj in self._changed.items():
+            if obj_id in store._offsets:
+                store._cache[obj_id] = obj
+        while len(store._cache) > LAZY_CACHE_SIZE:
+            store._cache.popitem(last=False)
+        return store
+
+    def _snapshot_lines(self) -> Iterator[tuple]:
+        """ Iterate over the (id, line) pairs of the snapshot still current,
+        in file order
+        """
+        released = 0
+        for obj_id in list(self._offsets):
+            start, stop = self._offsets[obj_id]
+            yield obj_id, self._mmap[start:stop]
+            if stop - released >= RELEASE_EVERY:
+                released = self._release(stop)
+
+    def raw_items(self) -> Iterator[tuple]:
+        """ Iterate over (id, JSON dict) pairs without building objects
+        """
+        for obj_id, line in self._snapshot_lines():
+            yield obj_id, json.loads(line)
+        for obj_id, obj in list(self._changed.items()):
+            yield obj_id, obj.to_json(True)
+
+    def raw_lines(self) -> Iterator[tuple]:
+        """ Iterate over (id, snapshot line) pairs, copying unchanged lines
+        verbatim
+        """
+        yield from self._snapshot_lines()
+        for obj_id, obj in list(self._changed.items()):
+            yield obj_id, json.dumps(obj.to_json(True)).encode()
+
+
+def flush(keys: List[str] = None):
+    """ Write a snapshot of every shard changed since the last flush, or
+    of those among `keys`
+
+    A shard whose snapshot fails stays dirty, for the next flush to retry;
+    the first error is raised once the other shards are written.
+    """
+    error = None
+    with _flush_lock:
+        with _dirty_lock:
+            dirty = [(key, DIRTY.pop(key)) for key in
+                     (list(DIRTY) if keys is None else keys) if key in DIRTY]
+        for key, (save, changes) in dirty:
+            try:
+                save()
+            except Exception as e:
+                with _dirty_lock:
+                    DIRTY[key] = (save, DIRTY.get(key, (save, 0))[1] + changes)
+                error = error or e
+    if error is not None:
+        raise error
+
+
+def _flush_loop():
+    """ Write-behind flusher: flush every DB_FLUSH_INTERVAL_MS, or as soon
+    as a shard piles up DB_FLUSH_EVERY changes
+    """
+    while True:
+        _flush_wanted.wait(FLUSH_INTERVAL_MS / 1000)
+        _flush_wanted.clear()
+        try:
+            flush()
+        except Exception:
+            logger.exception("Write-behind flush failed, retrying")
+
+
+def _mark_dirty(key: str, save: Callable):
+    """ Record a pending change of a shard for the write-behind flusher;
+    `save` writes its snapshot
+    """
+    global _flusher
+    with _dirty_lock:
+        changes = DIRTY.get(key, (save, 0))[1] + 1
+        DIRTY[key] = (save, changes)
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+    if changes >= FLUSH_EVERY:
+        _flush_wanted.set()
+
+
+def _ids_changed(s_class: str):
+    """ Drop the sorted ID list of a class after an insert or delete
+    """
+    with _ids_lock:
+        ID_GENERATIONS[s_class] = ID_GENERATIONS.get(s_class, 0) + 1
+        SORTED_IDS.pop(s_class, None)
+
+
+def _lock_fd(key: str) -> int:
+    """ File descriptor of the lock file of a shard, opened once
+    """
+    entry = FILE_LOCKS.get(key)
+    if entry is None:
+        with _locks_lock:
+            entry = FILE_LOCKS.get(key)
+            if entry is None:
+                fd = os.open(".db_{}.lock".format(key),
+                             os.O_RDWR | os.O_CREAT, 0o644)
+                entry = FILE_LOCKS[key] = [fd, 0]
+    return entry[0]
+
+
+def _generation(key: str) -> int:
+    """ Generation number of a shard, in its lock file: bumped by every
+    process that changes the shard's files
+    """
+    return int.from_bytes(os.pread(_lock_fd(key), 8, 0), 'little')
+
+
+def _bump_generation(key: str):
+    """ Tell other processes a shard's files changed; the caller holds the
+    lock file
+    """
+    generation = _generation(key) + 1
+    os.pwrite(_lock_fd(key), generation.to_bytes(8, 'little'), 0)
+
+
+@contextmanager
+def _file_lock(key: str, operation: int) -> Iterator[None]:
+    """ Hold the lock file of a shard, shared with other processes, with
+    `operation` fcntl.LOCK_SH or fcntl.LOCK_EX; only with DB_SHARED=1
+
+    Callers hold the shard's write lock, so one process never takes the
+    lock file twice at once; nested calls keep the outer lock.
+    """
+    if not SHARED:
+        yield
+        return
+    _lock_fd(key)
+    entry = FILE_LOCKS[key]
+    if entry[1] == 0:
+        fcntl.flock(entry[0], operation)
+    entry[1] += 1
+    try:
+        yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            fcntl.flock(entry[0], fcntl.LOCK_UN)
+
+
+def _fsync_dir(file_path: str):
+    """ Make the creation, removal or renaming of a file durable
+    """
+    fd = os.open(path.dirname(file_path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync():
+    """ fsync the journals appended to since the last sync
+    """
+    with _unsynced_lock:
+        unsynced = list(UNSYNCED)
+        UNSYNCED.clear()
+    for i, file_path in enumerate(unsynced):
+        try:
+            with open(file_path, 'rb') as f:
+                os.fsync(f.fileno())
+        except FileNotFoundError:
+            # compacted into a snapshot, which was synced itself
+            continue
+        except OSError:
+            with _unsynced_lock:
+                UNSYNCED.update(unsynced[i:])
+            raise
+
+
+def _sync_loop():
+    """ Background syncer of DB_FSYNC=interval
+    """
+    while True:
+        time.sleep(FSYNC_INTERVAL_MS / 1000)
+        try:
+            sync()
+        except Exception:
+            logger.exception("Background fsync failed")
+
+
+def _mark_unsynced(file_path: str):
+    """ Record a journal append for the next background sync
+    """
+    global _syncer
+    with _unsynced_lock:
+        UNSYNCED.add(file_path)
+        if _syncer is None:
+            _syncer = threading.Thread(target=_sync_loop, daemon=True)
+            _syncer.start()
+            atexit.register(sync)
+
+
+def _after_fork():
+    """ Give a forked child its own lock file descriptors and background
+    threads
+
+    flock doesn't exclude processes sharing one open file, as a parent
+    and its child do after a fork (e.g. gunicorn --preload). SEEN and
+    GENERATIONS still describe the child's copy of DATA and are kept.
+    """
+    global _flusher, _syncer
+    for fd, _ in FILE_LOCKS.values():
+        os.close(fd)
+    FILE_LOCKS.clear()
+    _flusher = None
+    _syncer = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+@lru_cache(maxsize=None)
+def _shard_keys(s_class: str) -> tuple:
+    """ Keys of the shards of a class: the class name itself when there is
+    a single shard, "<Class>.<n>" otherwise
+    """
+    if SHARDS == 1:
+        return (s_class,)
+    return tuple("{}.{}".format(s_class, n) for n in range(SHARDS))
+
+
+def _shard_key(s_class: str, obj_id: str) -> str:
+    """ Key of the shard holding an object, from a stable hash of its ID
+    """
+    keys = _shard_keys(s_class)
+    if SHARDS == 1:
+        return keys[0]
+    return keys[zlib.crc32(str(obj_id).encode()) % SHARDS]
+
+
+class FileStorage(Storage):
+    """ In-memory storage persisted to .db_<Class> files
+
+    With DB_SHARDS=N above 1, the objects of a class are split by a hash
+    of their ID into N shards, each with its own lock, indexes, snapshot
+    `.db_<Class>.<n>.<DB_FORMAT>` and journal, so writers to different
+    shards don't wait for each other and a save rewrites only one shard.
+
+    DB_FORMAT picks the snapshot format: "json" (default), line-delimited
+    "jsonl", or the compact binary "bin" (see models.binary_snapshot).
+
+    Changes are journaled as they happen, or with DB_WRITE_BEHIND=1 left
+    to a background thread that writes coalesced snapshots (see `flush`).
+    Models list in `__indexes__` the attributes to keep a hash index on;
+    `select` uses them for equality lookups.
+
+    Each shard's objects and indexes are guarded by a reader/writer lock;
+    iteration works on copies taken under the read lock.
+
+    Snapshots are written to a temporary file renamed over the old one, so
+    a crash never leaves a truncated snapshot. DB_FSYNC sets when writes
+    reach the disk: "always" fsyncs every journal append and snapshot,
+    "interval" (default) fsyncs snapshots and, every DB_FSYNC_INTERVAL_MS,
+    the journals appended to since, and "never" leaves it to the OS.
+
+    With DB_SHARED=1, several processes can share the files: writers hold
+    an exclusive lock on `.db_<Class>.lock` (per shard), catch up with
+    the files before changing them, and then bump the generation number
+    kept in the lock file. Every access first compares that number with
+    the one this process last saw, one read on an open file. On a
+    change, when only the journal grew, just the new entries are
+    applied; a new snapshot is reloaded in full. Changes are then always
+    journaled: DB_WRITE_BEHIND is ignored.
+    """
+
+    def load(self, cls):
+        """ Load all objects of a class from file
+
+        The snapshot of each shard is loaded first, then the changes
+        recorded since in its journal are replayed on top of it. With
+        DB_LAZY=1 and the line-delimited `jsonl` format, snapshots are only
+        indexed, and secondary indexes are built on the first search that
+        needs them. Files left by another DB_SHARDS setting are moved into
+        the current shards, and snapshots in another DB_FORMAT are
+        converted. Pending write-behind changes are flushed first.
+        """
+        s_class = cls.__name__
+        if WRITE_BEHIND:
+            flush()
+        _ids_changed(s_class)
+        self._remove_stale_temps(cls)
+        for key in _shard_keys(s_class):
+            self._load_shard(cls, key)
+        foreign_keys = self._foreign_keys(cls)
+        if foreign_keys:
+            self._migrate(cls, foreign_keys)
+
+    def _load_shard(self, cls, key: str, convert: bool = True):
+        """ Load one shard from its snapshot and journal
+
+        A snapshot found only in another format is rewritten in the
+        configured one, and removed, if `convert`.
+        """
+        with _lock(key).write(), _file_lock(key, fcntl.LOCK_EX):
+            old_path = self._read_shard(cls, key)
+            if old_path is not None and convert:
+                self._save_shard(cls, key)
+                os.remove(old_path)
+
+    def _read_shard(self, cls, key: str) -> str:
+        """ Read one shard from its files; the caller holds its locks
+
+        Without a snapshot in the configured format, the newest one in
+        another format is read, and its path returned.
+        """
+        file_path = self._snapshot_path(key)
+        old_path = None
+        DATA[key] = {}
+        JOURNAL_SIZES[key] = 0
+        INDEXES.pop(key, None)
+        INDEXED_VALUES.pop(key, None)
+        if path.exists(file_path):
+            self._read_snapshot(cls, key, file_path)
+        else:
+            old_paths = [self._snapshot_path(key, fmt)
+                         for fmt in SNAPSHOT_FORMATS if fmt != FORMAT]
+            old_paths = [p for p in old_paths if path.exists(p)]
+            if old_paths:
+                old_path = max(old_paths, key=path.getmtime)
+                self._read_snapshot(cls, key, old_path,
+                                    old_path.rsplit('.', 1)[1])
+        self._replay_journal(cls, key)
+        if not isinstance(DATA[key], LazyStore):
+            self._reindex_shard(cls, key)
+        self._remember(key)
+        return old_path
+
+    def _disk_state(self, key: str) -> tuple:
+        """ Identity of a shard's snapshot and length of its journal
+        """
+        try:
+            st = os.stat(self._snapshot_path(key))
+            snapshot = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            snapshot = None
+        try:
+            journal = os.stat(self._journal_path(key)).st_size
+        except FileNotFoundError:
+            journal = 0
+        return snapshot, journal
+
+    def _remember(self, key: str, changed: bool = False):
+        """ Record the state of a shard's files, now in memory, first
+        bumping its generation if this process `changed` them
+        """
+        if not SHARED:
+            return
+        if changed:
+            _bump_generation(key)
+        SEEN[key] = self._disk_state(key)
+        GENERATIONS[key] = _generation(key)
+
+    def _refresh(self, cls, key: str):
+        """ Catch up with the changes other processes made to a shard
+        """
+        if not SHARED or GENERATIONS.get(key) == _generation(key):
+            return
+        with _lock(key).write(), _file_lock(key, fcntl.LOCK_SH):
+            self._catch_up(cls, key)
+
+    def _catch_up(self, cls, key: str):
+        """ Apply the changes made to a shard's files since this process
+        last saw them; the caller holds its locks
+        """
+        if not SHARED:
+            return
+        snapshot, journal = self._disk_state(key)
+        seen = SEEN.get(key)
+        if seen == (snapshot, journal):
+            GENERATIONS[key] = _generation(key)
+            return
+        if seen is None or seen[0] != snapshot or journal < seen[1]:
+            self._read_shard(cls, key)
+        else:
+            self._replay_journal(cls, key, seen[1])
+            self._remember(key)
+        _ids_changed(cls.__name__)
+        cls._changed()
+
+    def refresh(self, cls):
+        """ Catch up with the changes other processes made to a class
+        """
+        for key in _shard_keys(cls.__name__):
+            self._refresh(cls, key)
+
+    def flush(self, cls):
+        """ Write the write-behind changes of a class now
+        """
+        flush(_shard_keys(cls.__name__))
+
+    def _foreign_keys(self, cls) -> List[str]:
+        """ Shard keys of the files of a class that don't belong to the
+        current DB_SHARDS setting
+        """
+        pattern = re.compile(r"\.db_({}(\.\d+)?)\.({}|journal)$".format(
+            re.escape(cls.__name__), '|'.join(SNAPSHOT_FORMATS)))
+        keys = set(_shard_keys(cls.__name__))
+        found = set()
+        for name in os.listdir('.'):
+            match = pattern.match(name)
+            if match and match.group(1) not in keys:
+                found.add(match.group(1))
+        return sorted(found)
+
+    def _remove_stale_temps(self, cls):
+        """ Remove the temporary snapshots left by processes that died
+        while writing them
+        """
+        pattern = re.compile(r"\.db_{}(\.\d+)?\.\w+\.(\d+)\.tmp$".format(
+            re.escape(cls.__name__)))
+        for name in os.listdir('.'):
+            match = pattern.match(name)
+            if match is None:
+                continue
+            pid = int(match.group(2))
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                os.remove(name)
+            except OSError:
+                continue
+
+    def _migrate(self, cls, foreign_keys: List[str]):
+        """ Move the objects of other shard files into the current shards,
+        then write the current shards and remove the other files
+        """
+        s_class = cls.__name__
+        for foreign_key in foreign_keys:
+            self._load_shard(cls, foreign_key, convert=False)
+            for obj_id in list(DATA[foreign_key]):
+                obj = DATA[foreign_key][obj_id]
+                key = _shard_key(s_class, obj_id)
+                with _lock(key).write():
+                    DATA[key][obj_id] = obj
+                    self._index_add(cls, key, obj)
+        for key in _shard_keys(s_class):
+            self._save_shard(cls, key)
+        for foreign_key in foreign_keys:
+            file_paths = [self._snapshot_path(foreign_key, fmt)
+                          for fmt in SNAPSHOT_FORMATS]
+            file_paths.append(self._journal_path(foreign_key))
+            for file_path in file_paths:
+                if path.exists(file_path):
+                    os.remove(file_path)
+            for registry in (DATA, INDEXES, INDEXED_VALUES, JOURNAL_SIZES):
+                registry.pop(foreign_key, None)
+        _ids_changed(s_class)
+
+    def _snapshot_path(self, key: str, fmt: str = None) -> str:
+        """ Path of the snapshot file of a shard, in the configured format
+        or `fmt`
+        """
+        return ".db_{}.{}".format(key, fmt or FORMAT)
+
+    def _journal_path(self, key: str) -> str:
+        """ Path of the journal file of a shard
+        """
+        return ".db_{}.journal".format(key)
+
+    def _read_snapshot(self, cls, key: str, file_path: str,
+                       fmt: str = None):
+        """ Load a shard from a snapshot in the configured format, or `fmt`
+        """
+        fmt = fmt or FORMAT
+        if fmt == "jsonl" and LAZY and fmt == FORMAT:
+            DATA[key] = LazyStore(cls, file_path)
+        elif fmt == "bin":
+            with open(file_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    for kwargs in binary_snapshot.load(m):
+                        DATA[key][kwargs['id']] = cls(**kwargs)
+        elif fmt == "jsonl":
+            with open(file_path, 'r') as f:
+                for line in f:
+                    obj_json = json.loads(line)
+                    DATA[key][obj_json['id']] = cls(**obj_json)
+        else:
+            with open(file_path, 'r') as f:
+                objs_json = json.load(f)
+                for obj_id, obj_json in objs_json.items():
+                    DATA[key][obj_id] = cls(**obj_json)
+
+    def _write_snapshot(self, key: str, f) -> dict:
+        """ Write every object of a shard to `f` in the configured format
+
+        Returns the line offsets of a lazily loaded shard, so that the
+        new snapshot needn't be scanned again to open it.
+        """
+        store = DATA[key]
+        if FORMAT == "jsonl" and isinstance(store, LazyStore):
+            offsets, start = {}, 0
+            for obj_id, line in store.raw_lines():
+                f.write(line)
+                f.write(b"\n")
+                offsets[obj_id] = (start, start + len(line))
+                start += len(line) + 1
+            return offsets
+        elif FORMAT == "bin":
+            binary_snapshot.dump(list(store.values()), f)
+        elif FORMAT == "jsonl":
+            for obj in store.values():
+                f.write(json.dumps(obj.to_json(True)).encode())
+                f.write(b"\n")
+        else:
+            objs_json = {}
+            for obj_id, obj in store.items():
+                objs_json[obj_id] = obj.to_json(True)
+            f.write(json.dumps(objs_json).encode())
+
+    def _replay_journal(self, cls, key: str, offset: int = 0):
+        """ Apply the journal entries written since the last snapshot, or
+        from byte `offset` on, keeping the indexes up to date
+
+        A torn last line, left by a crash in the middle of an append, is
+        cut off so that later appends start on a clean line; a whole last
+        entry that only lacks its newline gets it. An unreadable line
+        before the last raises ValueError rather than dropping the entries
+        after it.
+        """
+        journal_path = self._journal_path(key)
+        if not path.exists(journal_path):
+            return
+        with open(journal_path, 'rb+') as f:
+            f.seek(offset)
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    if f.read(1):
+                        raise ValueError("Corrupt entry in {} at byte {}"
+                                         .format(journal_path, offset))
+                    f.truncate(offset)
+                    break
+                if not line.endswith(b"\n"):
+                    f.write(b"\n")
+                    line += b"\n"
+                if entry['op'] == 'put':
+                    obj_json = entry['obj']
+                    obj = cls(**obj_json)
+                    DATA[key][obj_json['id']] = obj
+                    if key in INDEXES:
+                        self._index_remove(key, obj.id)
+                        self._index_add(cls, key, obj)
+                else:
+                    DATA[key].pop(entry['id'], None)
+                    self._index_remove(key, entry['id'])
+                JOURNAL_SIZES[key] += 1
+                offset += len(line)
+
+    def _append_journal(self, cls, key: str, entry: dict):
+        """ Record one change in the journal of a shard, compacting it when
+        it has more entries than DB_JOURNAL_COMPACT_EVERY and half the
+        objects of the shard: a compaction rewrites the whole shard, so
+        the amortized cost of a change stays constant as it grows.
+        A lazily loaded shard is also compacted once it holds
+        DB_LAZY_CACHE_SIZE objects stored since its snapshot, so that
+        memory stays bounded
+        """
+        journal_path = self._journal_path(key)
+        with open(journal_path, 'a') as f:
+            created = f.tell() == 0
+            f.write(json.dumps(entry) + "\n")
+            if FSYNC == "always":
+                f.flush()
+                os.fsync(f.fileno())
+        if FSYNC == "always":
+            if created:
+                _fsync_dir(journal_path)
+        elif FSYNC == "interval":
+            _mark_unsynced(journal_path)
+        JOURNAL_SIZES[key] = JOURNAL_SIZES.get(key, 0) + 1
+        self._remember(key, changed=True)
+        store = DATA.get(key, ())
+        if JOURNAL_SIZES[key] >= max(JOURNAL_COMPACT_EVERY, len(store) // 2) \
+                or isinstance(store, LazyStore) and \
+                store.changed_count() >= LAZY_CACHE_SIZE:
+            self._save_shard(cls, key)
+
+    def reindex(self, cls):
+        """ Rebuild the secondary indexes of a class from DATA
+        """
+        for key in _shard_keys(cls.__name__):
+            self._reindex_shard(cls, key)
+
+    def _reindex_shard(self, cls, key: str):
+        """ Rebuild the secondary indexes of one shard
+        """
+        with _lock(key).write():
+            INDEXES[key] = {attr: {} for attr in cls.__indexes__}
+            INDEXED_VALUES[key] = {}
+            store = DATA.get(key, {})
+            if isinstance(store, LazyStore):
+                objs = (obj_json for _, obj_json in store.raw_items())
+            else:
+                objs = store.values()
+            for obj in objs:
+                self._index_add(cls, key, obj)
+
+    def _index_add(self, cls, key: str, obj: TypeVar('Base')):
+        """ Add an object, or its JSON dictionary, to the secondary indexes
+        of a shard
+        """
+        if not cls.__indexes__:
+            return
+        if key not in INDEXES:
+            # a lazy store builds its indexes on the first search instead
+            if not isinstance(DATA.get(key), LazyStore):
+                self._reindex_shard(cls, key)
+            return
+        if isinstance(obj, dict):
+            obj_id, get = obj['id'], obj.get
+        else:
+            obj_id, get = obj.id, lambda attr: getattr(obj, attr, None)
+        values = {}
+        for attr in cls.__indexes__:
+            value = get(attr)
+            try:
+                INDEXES[key][attr].setdefault(value, {})[obj_id] = None
+            except TypeError:
+                continue
+            values[attr] = value
+        INDEXED_VALUES[key][obj_id] = values
+
+    def _index_remove(self, key: str, obj_id: str):
+        """ Drop an object from the secondary indexes of a shard
+        """
+        values = INDEXED_VALUES.get(key, {}).pop(obj_id, None)
+        if values is None:
+            return
+        for attr, value in values.items():
+            ids = INDEXES[key][attr][value]
+            del ids[obj_id]
+            if not ids:
+                del INDEXES[key][attr][value]
+
+    def save_all(self, cls):
+        """ Save all objects of a class to file, shard by shard
+        """
+        for key in _shard_keys(cls.__name__):
+            self._save_shard(cls, key)
+
+    def _save_shard(self, cls, key: str):
+        """ Save the objects of one shard to file
+
+        Writes a full snapshot, which makes the journal redundant. The
+        snapshot goes to a temporary file renamed over the old one, so
+        readers never see it half written and a crash leaves either the
+        old or the new snapshot. Unless DB_FSYNC=never, the file is
+        fsynced before the rename and the directory after it. Writers are
+        held off until the journal is gone, so no change can fall between
+        the two.
+        """
+        file_path = self._snapshot_path(key)
+        journal_path = self._journal_path(key)
+        with _lock(key).write(), _file_lock(key, fcntl.LOCK_EX):
+            self._catch_up(cls, key)
+            DATA.setdefault(key, {})
+            tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+            try:
+                with open(tmp_path, 'wb') as f:
+                    offsets = self._write_snapshot(key, f)
+                    if FSYNC != "never":
+                        f.flush()
+                        os.fsync(f.fileno())
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, file_path)
+            if path.exists(journal_path):
+                os.remove(journal_path)
+            if FSYNC != "never":
+                _fsync_dir(file_path)
+            JOURNAL_SIZES[key] = 0
+            if isinstance(DATA[key], LazyStore):
+                DATA[key] = DATA[key].reopen(file_path, offsets)
+            self._remember(key, changed=True)
+
+    def put(self, obj: TypeVar('Base')):
+        """ Store an object
+        """
+        cls = obj.__class__
+        key = _shard_key(cls.__name__, obj.id)
+        with _lock(key).write(), _file_lock(key, fcntl.LOCK_EX):
+            self._catch_up(cls, key)
+            store = DATA.setdefault(key, {})
+            if obj.id not in store:
+                _ids_changed(cls.__name__)
+            store[obj.id] = obj
+            self._index_remove(key, obj.id)
+            self._index_add(cls, key, obj)
+            if WRITE_BEHIND:
+                _mark_dirty(key, lambda: self._save_shard(cls, key))
+            else:
+                self._append_journal(cls, key, {'op': 'put',
+                                                'obj': obj.to_json(True)})
+
+    def delete(self, obj: TypeVar('Base')):
+        """ Remove an object
+        """
+        cls = obj.__class__
+        key = _shard_key(cls.__name__, obj.id)
+        with _lock(key).write(), _file_lock(key, fcntl.LOCK_EX):
+            self._catch_up(cls, key)
+            if DATA.get(key, {}).pop(obj.id, None) is None:
+                return
+            _ids_changed(cls.__name__)
+            self._index_remove(key, obj.id)
+            if WRITE_BEHIND:
+                _mark_dirty(key, lambda: self._save_shard(cls, key))
+            else:
+                self._append_journal(cls, key, {'op': 'del', 'id': obj.id})
+
+    def count(self, cls) -> int:
+        """ Count all objects of a class, from the size of each shard
+        """
+        self.refresh(cls)
+        return sum(len(DATA.get(key, {}))
+                   for key in _shard_keys(cls.__name__))
+
+    def get(self, cls, obj_id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        key = _shard_key(cls.__name__, obj_id)
+        self._refresh(cls, key)
+        return DATA.get(key, {}).get(obj_id)
+
+    def iterate(self, cls, after: str = None) -> Iterator[TypeVar('Base')]:
+        """ Yield all objects of a class in ID order, starting after the
+        ID `after`
+
+        The sorted ID list is kept until an object is added or removed;
+        a list built while that happened is used once but not kept.
+        """
+        s_class = cls.__name__
+        self.refresh(cls)
+        ids = SORTED_IDS.get(s_class)
+        if ids is None:
+            generation = ID_GENERATIONS.get(s_class, 0)
+            ids = []
+            for key in _shard_keys(s_class):
+                with _lock(key).read():
+                    ids.extend(DATA.get(key, {}))
+            ids.sort()
+            with _ids_lock:
+                if ID_GENERATIONS.get(s_class, 0) == generation:
+                    SORTED_IDS[s_class] = ids
+        start = 0 if after is None else bisect.bisect_right(ids, after)
+        for i in range(start, len(ids), ITERATE_BATCH):
+            batch = ids[i:i + ITERATE_BATCH]
+            by_shard = {}
+            for obj_id in batch:
+                by_shard.setdefault(_shard_key(s_class, obj_id),
+                                    []).append(obj_id)
+            objs = {}
+            for key, shard_ids in by_shard.items():
+                objs.update(zip(shard_ids, self._fetch(key, shard_ids)))
+            for obj_id in batch:
+                if objs[obj_id] is not None:
+                    yield objs[obj_id]
+
+    def select(self, cls, predicates: list) -> Iterator[TypeVar('Base')]:
+        """ Yield the objects of a class matching all the (attribute,
+        operator, value) predicates, lazily, shard after shard
+
+        In each shard, of the `eq` and `in` predicates on indexed
+        attributes, the one with the fewest candidates picks the objects
+        to check; otherwise every object is. The other predicates are
+        checked cheapest first.
+        """
+        for key in _shard_keys(cls.__name__):
+            self._refresh(cls, key)
+            yield from self._select_shard(cls, key, predicates)
+
+    def _select_shard(self, cls, key: str,
+                      predicates: list) -> Iterator[TypeVar('Base')]:
+        """ Matching objects of one shard
+        """
+        if cls.__indexes__ and key not in INDEXES and \
+                any(p[0] in cls.__indexes__ for p in predicates):
+            self._reindex_shard(cls, key)
+        with _lock(key).read():
+            best, best_size = None, None
+            indexes = INDEXES.get(key, {})
+            for predicate in predicates:
+                attr, op, value = predicate
+                if attr not in indexes or op not in ('eq', 'in'):
+                    continue
+                try:
+                    values = [value] if op == 'eq' else set(value)
+                    size = sum(len(indexes[attr].get(v, ())) for v in values)
+                except TypeError:
+                    continue
+                if best is None or size < best_size:
+                    best, best_size = (predicate, values), size
+            if best is None:
+                candidates = list(DATA.get(key, {}))
+            else:
+                (attr, _, _), values = best
+                candidates = [obj_id for v in values
+                              for obj_id in indexes[attr].get(v, ())]
+        # the index only narrows the candidates down: it misses the changes
+        # made to the objects in memory since their last save
+        test = self.compile(predicates)
+        for i in range(0, len(candidates), ITERATE_BATCH):
+            for obj in self._fetch(key, candidates[i:i + ITERATE_BATCH]):
+                if obj is not None and test(obj):
+                    yield obj
+
+    def _fetch(self, key: str, ids: list) -> list:
+        """ Objects of a shard with the given IDs, read under its read
+        lock; None for the ones removed since
+        """
+        with _lock(key).read():
+            store = DATA.get(key, {})
+            return [store.get(obj_id) for obj_id in ids]
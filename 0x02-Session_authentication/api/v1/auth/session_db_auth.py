@@ -33,17 +33,17 @@ class SessionDBAuth(SessionExpAuth):
         Retrieves user ID associated with a given session ID from  database
         """
         try:
-            sessions = UserSession.search({'session_id': session_id})
+            user_session = UserSession.query(session_id=session_id).first()
         except Exception:
             return None
-        if len(sessions) <= 0:
+        if user_session is None:
             return None
         current_time = datetime.now()
         time_span = timedelta(seconds=self.session_duration)
-        expire_time = sessions[0].created_at + time_span
+        expire_time = user_session.created_at + time_span
         if expire_time < current_time:
             return None
-        return sessions[0].user_id
+        return user_session.user_id
 
     def destroy_session(self, request=None) -> bool:
         """
@@ -51,10 +51,10 @@ class SessionDBAuth(SessionExpAuth):
         """
         session_id = self.session_cookie(request)
         try:
-            sessions = UserSession.search({'session_id': session_id})
+            user_session = UserSession.query(session_id=session_id).first()
         except Exception:
             return False
-        if len(sessions) <= 0:
+        if user_session is None:
             return False
-        sessions[0].remove()
+        user_session.remove()
         return True
@@ -2,18 +2,89 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import abort, current_app, json, jsonify, request, url_for
+from itertools import islice
 from models.user import User
 
+# (User.version(), encoded body) of the last GET /api/v1/users
+_all_users_body = (None, None)
+STREAM_CHUNK = 100
+
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (all optional):
+      - limit: number of Users per page, in ID order
+      - after: ID of the last User of the previous page
+      - fields: comma separated attributes to return (id is always
+        returned), e.g. email,first_name
+      - format=ndjson: stream one JSON object per line
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented; a full page links to
+        the next one in a Link header
+      - 400 if a parameter is invalid
+    Without parameters, the encoded list is reused until a User is saved,
+    removed or loaded.
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    global _all_users_body
+    args = request.args
+    if not any(k in args for k in ('limit', 'after', 'fields', 'format')):
+        version, body = _all_users_body
+        if version is None or version != User.version():
+            version = User.version()
+            all_users = [user.to_json() for user in User.all()]
+            body = jsonify(all_users).get_data()
+            _all_users_body = (version, body)
+        return current_app.response_class(
+            body, mimetype='application/json')
+
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            return jsonify({'error': "limit must be a positive integer"}), 400
+    fields = args.get('fields')
+    if fields:
+        fields = ['id'] + [f for f in fields.split(',') if f != 'id']
+        public = [f for f in User.__fields__ if f[0] != '_']
+        for field in fields:
+            if field not in public:
+                error_msg = "Unknown field: {}".format(field)
+                return jsonify({'error': error_msg}), 400
+
+    def project(user):
+        """ JSON of a User, reduced to the requested fields """
+        user_json = user.to_json()
+        if not fields:
+            return user_json
+        return {field: user_json.get(field) for field in fields}
+
+    users = islice(User.iterate(args.get('after')), limit)
+    if args.get('format') == 'ndjson':
+        dumps = json.dumps
+
+        def stream():
+            """ NDJSON lines, STREAM_CHUNK Users at a time """
+            while True:
+                chunk = [dumps(project(user), separators=(',', ':'))
+                         for user in islice(users, STREAM_CHUNK)]
+                if not chunk:
+                    return
+                yield "\n".join(chunk) + "\n"
+        return current_app.response_class(stream(),
+                                          mimetype='application/x-ndjson')
+
+    page = [project(user) for user in users]
+    response = jsonify(page)
+    if limit is not None and len(page) == limit:
+        next_args = dict(args.items(), after=page[-1]['id'])
+        response.headers['Link'] = '<{}>; rel="next"'.format(
+            url_for('app_views.view_all_users', **next_args))
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -2,38 +2,100 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
-import json
+from typing import TypeVar, List, Iterable, Iterator
+from os import getenv
+import itertools
+import re
 import uuid
+from models.query import Query
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
-DATA = {}
+# TIMESTAMP_FORMAT with zero-padded fields, the only form handed to
+# fromisoformat, which accepts more than strptime
+CANONICAL_TIMESTAMP = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d", re.ASCII)
+VERSIONS = {}
+_versions = itertools.count(1)
+
+storage = None
+backend = getenv("DB_BACKEND", "file")
+
+if backend == "sqlite":
+    from models.sqlite_storage import SQLiteStorage
+    storage = SQLiteStorage()
+else:
+    from models.file_storage import FileStorage
+    storage = FileStorage()
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+
+    The canonical form is read with fromisoformat, much faster than
+    strptime; anything else still goes through strptime. Datetimes, as
+    decoded from binary snapshots, are returned as is.
+    """
+    if type(value) is datetime:
+        return value
+    if CANONICAL_TIMESTAMP.fullmatch(value):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def format_timestamp(value: datetime) -> str:
+    """ Format a datetime as TIMESTAMP_FORMAT
+    """
+    if value.tzinfo is None and value.year >= 1000:
+        return value.isoformat(timespec='seconds')
+    return value.strftime(TIMESTAMP_FORMAT)
 
 
 class Base():
     """ Base class
+
+    Objects are kept by the storage backend selected with DB_BACKEND:
+    "file" (default, see models.file_storage) or "sqlite" (see
+    models.sqlite_storage). Subclasses list in `__indexes__` the
+    attributes the backend should index for equality lookups.
+
+    Attributes live in `__slots__` rather than a per-instance `__dict__`;
+    each subclass declares its own, and `__fields__` lists them all in
+    declaration order for `to_json`. Private `__` slots are left out.
+
+    `to_json()` is cached until an attribute is set, and `version()`
+    changes whenever an object of the class is saved, removed or loaded.
     """
+    __indexes__ = ()
+    __slots__ = ('id', 'created_at', 'updated_at', '__json')
+    __fields__ = ('id', 'created_at', 'updated_at')
+
+    def __init_subclass__(cls, **kwargs: dict):
+        """ Collect the slots of a subclass and of its bases
+        """
+        super().__init_subclass__(**kwargs)
+        fields = []
+        for klass in reversed(cls.__mro__):
+            for name in klass.__dict__.get('__slots__', ()):
+                if name not in fields and name[:2] != '__':
+                    fields.append(name)
+        cls.__fields__ = tuple(fields)
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
-        s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
-
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
-            self.updated_at = datetime.utcnow()
+            # datetimes are immutable: a new object shares its creation time
+            self.updated_at = self.created_at
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -44,69 +106,90 @@ class Base():
             return False
         return (self.id == other.id)
 
+    def __setattr__(self, name: str, value):
+        """ Set an attribute, dropping the cached JSON projection
+        """
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, '_Base__json', None)
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
+        if not for_serialization and self.__json is not None:
+            return dict(self.__json)
+        attributes = {}
+        for key in self.__fields__:
+            try:
+                attributes[key] = getattr(self, key)
+            except AttributeError:
+                continue
+        attributes.update(getattr(self, '__dict__', {}))
+
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in attributes.items():
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
+                result[key] = format_timestamp(value)
             else:
                 result[key] = value
+        if not for_serialization:
+            object.__setattr__(self, '_Base__json', result)
+            return dict(result)
         return result
 
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from storage
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
-
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        storage.load(cls)
+        cls._changed()
 
     @classmethod
     def save_to_file(cls):
-        """ Save all objects to file
+        """ Persist all objects to storage
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        storage.save_all(cls)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def flush(cls):
+        """ Persist the changes storage still holds in memory, e.g. with
+        DB_WRITE_BEHIND
+        """
+        storage.flush(cls)
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        storage.put(self)
+        self.__class__._changed()
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        storage.delete(self)
+        self.__class__._changed()
+
+    @classmethod
+    def version(cls) -> int:
+        """ Version of the class's objects, after catching up with the
+        changes other processes made
+        """
+        storage.refresh(cls)
+        return VERSIONS.get(cls.__name__, 0)
+
+    @classmethod
+    def _changed(cls):
+        """ Give the class a new version
+        """
+        VERSIONS[cls.__name__] = next(_versions)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return storage.count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -114,24 +197,28 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def iterate(cls, after: str = None) -> Iterator[TypeVar('Base')]:
+        """ Iterate over all objects in ID order, starting after the ID
+        `after`, without building the full list
+        """
+        return storage.iterate(cls, after)
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return storage.get(cls, id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        return storage.search(cls, attributes)
+
+    @classmethod
+    def query(cls, **predicates: dict) -> Query:
+        """ Lazy query on the objects, e.g.
+        User.query(email__prefix="bob", created_at__gte=when).first()
+        """
+        return Query(cls, storage).filter(**predicates)
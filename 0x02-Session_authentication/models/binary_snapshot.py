@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+""" Binary snapshot module: a compact, columnar encoding of model objects
+
+Layout, little-endian, every section padded to 8 bytes:
+  - header: magic b"HBDB", version (uint16), number of objects n (uint32),
+    number of extra columns (uint16), id kind (uint8: 0 UUIDs, 1 text)
+  - id column: n UUIDs of 16 bytes, stored as five blocks holding each
+    group of the UUID of every object in turn, or a text column
+  - created_at and updated_at: n int64 seconds since the epoch each,
+    INT64_MIN for None
+  - one column per other attribute: name, kind (uint8: 0 text, 1 JSON),
+    then a text column
+A text column is n state bytes (0 absent, 1 None, 2 value), n + 1 int64
+character offsets, and the values concatenated in one UTF-8 blob. JSON
+columns hold the JSON text of each value.
+
+Fixed-size sections are read with `memoryview.cast`, without copying,
+and columns are decoded with map/slice rather than one object at a time.
+"""
+from datetime import datetime, timedelta
+from itertools import accumulate, chain, repeat
+from operator import itemgetter
+from typing import Iterator, List
+import json
+import struct
+
+MAGIC = b"HBDB"
+VERSION = 1
+HEADER = struct.Struct("<4sHIHB")
+NONE_TIME = -2 ** 63
+EPOCH = datetime(1970, 1, 1)
+ONE_SECOND = timedelta(seconds=1)
+STATE_ABSENT, STATE_NULL, STATE_VALUE = 0, 1, 2
+TEXT, JSON = 0, 1
+ABSENT = object()
+UUID_GROUPS = ((0, 4), (4, 6), (6, 8), (8, 10), (10, 16))
+TEXT_TYPES = {str, type(None), type(ABSENT)}
+
+
+def _pad(size: int) -> bytes:
+    """ Padding to the next multiple of 8 bytes
+    """
+    return b"\0" * (-size % 8)
+
+
+def _uuid_blocks(ids: list) -> List[bytes]:
+    """ The five group blocks of a list of lowercase, canonical UUID
+    strings, or None if any ID is something else
+    """
+    try:
+        raw = bytes.fromhex("".join(ids).replace('-', ''))
+    except (TypeError, ValueError):
+        return None
+    if not ids or len(raw) != 16 * len(ids):
+        return None
+    blocks = []
+    for start, stop in UUID_GROUPS:
+        width = stop - start
+        block = bytearray(len(ids) * width)
+        for j in range(width):
+            block[j::width] = raw[start + j::16]
+        blocks.append(bytes(block))
+    if _uuid_strings(blocks) != ids:
+        return None
+    return blocks
+
+
+def _uuid_strings(blocks: list) -> List[str]:
+    """ UUID strings from their five group blocks
+    """
+    groups = [memoryview(block).hex(' ', stop - start).split(' ')
+              for block, (start, stop) in zip(blocks, UUID_GROUPS)]
+    return list(map('-'.join, zip(*groups)))
+
+
+def _text_column(values: list, kind: int) -> List[bytes]:
+    """ Encode a text column; values are strings (any JSON value for a
+    JSON column), None, or ABSENT
+    """
+    if kind == TEXT and all(type(v) is str for v in values):
+        states = bytes([STATE_VALUE]) * len(values)
+        parts = values
+        offsets = list(accumulate(chain((0,), map(len, values))))
+    else:
+        states = bytearray(len(values))
+        offsets = [0]
+        parts = []
+        position = 0
+        for i, value in enumerate(values):
+            if value is ABSENT:
+                states[i] = STATE_ABSENT
+            elif value is None:
+                states[i] = STATE_NULL
+            else:
+                if kind == JSON:
+                    value = json.dumps(value)
+                states[i] = STATE_VALUE
+                parts.append(value)
+                position += len(value)
+            offsets.append(position)
+    blob = "".join(parts).encode()
+    chunks = [bytes(states), _pad(len(states)),
+              struct.pack("<{}q".format(len(offsets)), *offsets),
+              struct.pack("<Q", len(blob)), blob, _pad(len(blob))]
+    return chunks
+
+
+def _timestamp(value) -> int:
+    """ Seconds since the epoch of a naive datetime, NONE_TIME for None
+    """
+    if type(value) is not datetime:
+        return NONE_TIME
+    return (value - EPOCH) // ONE_SECOND
+
+
+def dump(objs: list, f):
+    """ Write model objects to the binary file `f`
+    """
+    rows = [obj.to_json(True) for obj in objs]
+    layouts = list(dict.fromkeys(map(tuple, rows)))
+    names = []
+    for layout in layouts:
+        for name in layout:
+            if name not in ('id', 'created_at', 'updated_at') and \
+                    name not in names:
+                names.append(name)
+
+    ids = [obj.id for obj in objs]
+    blocks = _uuid_blocks(ids)
+    f.write(HEADER.pack(MAGIC, VERSION, len(objs), len(names),
+                        1 if blocks is None else 0))
+    f.write(_pad(HEADER.size))
+    if blocks is None:
+        f.write(b"".join(_text_column(list(map(str, ids)), TEXT)))
+    else:
+        for block in blocks:
+            f.write(block)
+            f.write(_pad(len(block)))
+
+    for attr in ('created_at', 'updated_at'):
+        f.write(struct.pack("<{}q".format(len(objs)), *(
+            _timestamp(getattr(obj, attr, None)) for obj in objs)))
+
+    for name in names:
+        if all(name in layout for layout in layouts):
+            values = list(map(itemgetter(name), rows))
+        else:
+            values = [row.get(name, ABSENT) for row in rows]
+        kind = TEXT
+        if not set(map(type, values)) <= TEXT_TYPES:
+            kind = JSON
+        encoded = name.encode()
+        f.write(struct.pack("<H", len(encoded)) + encoded)
+        f.write(_pad(2 + len(encoded)))
+        f.write(struct.pack("<B", kind))
+        f.write(_pad(1))
+        f.write(b"".join(_text_column(values, kind)))
+
+
+class _Reader():
+    """ Cursor over a memoryview of a snapshot
+    """
+
+    def __init__(self, view: memoryview):
+        """ Start at the beginning of `view`
+        """
+        self.view = view
+        self.offset = 0
+
+    def take(self, size: int) -> memoryview:
+        """ The next `size` bytes, then skip to the next 8 byte boundary
+        """
+        chunk = self.view[self.offset:self.offset + size]
+        self.offset += size + (-size % 8)
+        return chunk
+
+    def text_column(self, n: int, kind: int) -> list:
+        """ Decode a text column of n values, ABSENT where missing
+        """
+        states = self.take(n)
+        offsets = self.take(8 * (n + 1)).cast('q')
+        blob_size, = struct.unpack_from("<Q", self.take(8))
+        text = str(self.take(blob_size), 'utf-8')
+        offsets = offsets.tolist()
+        states = bytes(states)
+        if states.count(STATE_NULL) == n:
+            return [None] * n
+        if kind == TEXT and states.count(STATE_VALUE) == n:
+            return list(map(text.__getitem__,
+                            map(slice, offsets[:-1], offsets[1:])))
+        values = []
+        for i, state in enumerate(states):
+            if state == STATE_VALUE:
+                value = text[offsets[i]:offsets[i + 1]]
+                values.append(json.loads(value) if kind == JSON else value)
+            else:
+                values.append(None if state == STATE_NULL else ABSENT)
+        return values
+
+
+def load(buffer) -> Iterator[dict]:
+    """ Yield the keyword arguments of each object of a binary snapshot
+
+    `buffer` is any bytes-like object, e.g. an mmap of the file.
+    Timestamps are returned as datetimes.
+    """
+    reader = _Reader(memoryview(buffer))
+    magic, version, n, n_columns, id_kind = HEADER.unpack_from(
+        reader.take(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a binary snapshot")
+    if version != VERSION:
+        raise ValueError("Unsupported snapshot version: {}".format(version))
+
+    if n == 0:
+        return iter(())
+    if id_kind == 0:
+        ids = _uuid_strings([reader.take(n * (stop - start))
+                             for start, stop in UUID_GROUPS])
+    else:
+        ids = reader.text_column(n, TEXT)
+
+    columns = [('id', ids)]
+    for attr in ('created_at', 'updated_at'):
+        seconds = reader.take(8 * n).cast('q').tolist()
+        times = {t: None if t == NONE_TIME else EPOCH + t * ONE_SECOND
+                 for t in set(seconds)}
+        columns.append((attr, list(map(times.__getitem__, seconds))))
+
+    for _ in range(n_columns):
+        size, = struct.unpack_from("<H", reader.view, reader.offset)
+        name = str(reader.take(2 + size)[2:], 'utf-8')
+        kind = reader.take(1)[0]
+        columns.append((name, reader.text_column(n, kind)))
+
+    names = [name for name, _ in columns]
+    sparse = [name for name, values in columns if ABSENT in values]
+    rows = map(dict, map(zip, repeat(names),
+                         zip(*(values for _, values in columns))))
+    if not sparse:
+        return rows
+    return _drop_absent(rows, sparse)
+
+
+def _drop_absent(rows: Iterator[dict], sparse: list) -> Iterator[dict]:
+    """ Remove the attributes an object didn't have
+    """
+    for kwargs in rows:
+        for name in sparse:
+            if kwargs[name] is ABSENT:
+                del kwargs[name]
+        yield kwargs
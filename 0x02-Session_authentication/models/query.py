@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+""" Query module
+"""
+from itertools import islice
+from typing import TypeVar, List, Iterator
+from models.storage import OPERATORS
+
+
+class Query():
+    """ Lazy query over the objects of a model class
+
+    Built with `Base.query(**predicates)`. Each keyword is an attribute
+    name, optionally followed by an operator:
+      - email="bob@hbtn.io": equality
+      - email__in=["bob@hbtn.io", "bill@hbtn.io"]: membership
+      - email__prefix="bob": string prefix
+      - created_at__gte=when: range, with __gt, __gte, __lt and __lte
+    The storage backend answers what it can from its indexes; nothing is
+    read before the query is iterated.
+    """
+
+    def __init__(self, cls, storage, predicates: tuple = (),
+                 limit: int = None):
+        """ Query the objects of `cls` kept in `storage`
+        """
+        self.cls = cls
+        self.storage = storage
+        self.predicates = predicates
+        self._limit = limit
+
+    def filter(self, **predicates: dict) -> 'Query':
+        """ Return a query with more predicates
+        """
+        added = []
+        for key, value in predicates.items():
+            attr, _, op = key.rpartition('__')
+            if not attr:
+                attr, op = key, 'eq'
+            elif op not in OPERATORS:
+                raise ValueError("Unknown operator: {}".format(op))
+            added.append((attr, op, value))
+        return Query(self.cls, self.storage,
+                     self.predicates + tuple(added), self._limit)
+
+    def limit(self, limit: int) -> 'Query':
+        """ Return a query stopping after `limit` objects
+        """
+        return Query(self.cls, self.storage, self.predicates, limit)
+
+    def __iter__(self) -> Iterator[TypeVar('Base')]:
+        """ Iterate over the matching objects
+        """
+        objs = self.storage.select(self.cls, list(self.predicates))
+        if self._limit is None:
+            return iter(objs)
+        return islice(objs, self._limit)
+
+    def first(self) -> TypeVar('Base'):
+        """ Return the first matching object, or None
+        """
+        return next(iter(self.limit(1)), None)
+
+    def all(self) -> List[TypeVar('Base')]:
+        """ Return the matching objects as a list
+        """
+        return list(self)
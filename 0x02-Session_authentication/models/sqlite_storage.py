@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+""" SQLite storage module
+"""
+from typing import TypeVar, Iterator
+from os import getenv
+import json
+import sqlite3
+import threading
+from models.storage import Storage
+
+
+SQLITE_PATH = getenv("DB_SQLITE_PATH", ".db.sqlite3")
+SQL_TYPES = (str, int, float)
+ITERATE_BATCH = 500
+SYNCHRONOUS = {"always": "FULL", "interval": "NORMAL", "never": "OFF"}[
+    getenv("DB_FSYNC", "interval")]
+
+
+class SQLiteStorage(Storage):
+    """ Storage in a SQLite database, one table per class
+
+    Each row holds the object's JSON dictionary; the attributes listed in
+    the model's `__indexes__` also get a real, indexed column, so equality
+    on them is answered by SQLite instead of a scan. Other attributes are
+    checked on the decoded objects.
+
+    The database runs in WAL mode, so readers never wait for the writer,
+    and every thread has its own connection. Statements are built once per
+    class and only take parameters, which keeps them in sqlite3's
+    statement cache. DB_FSYNC maps to SQLite's synchronous setting:
+    "always" is FULL, "interval" NORMAL (synced at checkpoints) and
+    "never" OFF.
+    """
+
+    def __init__(self, file_path: str = SQLITE_PATH):
+        """ Use the database at `file_path`
+        """
+        self.file_path = file_path
+        self._local = threading.local()
+        self._tables = {}
+        self._tables_lock = threading.Lock()
+        self._watch = None
+        self._watch_lock = threading.Lock()
+        self._data_versions = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.file_path, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous={}".format(SYNCHRONOUS))
+            self._local.conn = conn
+        return conn
+
+    def refresh(self, cls):
+        """ Give a class a new version when another connection, in this
+        process or another, changed the database since the last check
+
+        Reads always see the current database; this only keeps cached
+        views in step. SQLite's data_version counts the commits of other
+        connections, so it is read on a connection of its own.
+        """
+        with self._watch_lock:
+            if self._watch is None:
+                self._watch = sqlite3.connect(self.file_path,
+                                              isolation_level=None,
+                                              check_same_thread=False)
+            data_version = self._watch.execute(
+                "PRAGMA data_version").fetchone()[0]
+            seen = self._data_versions.setdefault(cls.__name__, data_version)
+            self._data_versions[cls.__name__] = data_version
+        if seen != data_version:
+            cls._changed()
+
+    def _table(self, cls) -> dict:
+        """ Create the table of a class if needed and return its statements
+        """
+        sql = self._tables.get(cls.__name__)
+        if sql is not None:
+            return sql
+        with self._tables_lock:
+            sql = self._tables.get(cls.__name__)
+            if sql is not None:
+                return sql
+            table = '"{}"'.format(cls.__name__)
+            columns = ['"{}"'.format(attr) for attr in cls.__indexes__]
+            conn = self._connection()
+            conn.execute("CREATE TABLE IF NOT EXISTS {} ("
+                         "id TEXT PRIMARY KEY, data TEXT NOT NULL{})".format(
+                             table, "".join(", " + c for c in columns)))
+            for attr, column in zip(cls.__indexes__, columns):
+                conn.execute('CREATE INDEX IF NOT EXISTS "{}_{}" '
+                             'ON {} ({})'.format(cls.__name__, attr,
+                                                 table, column))
+            sql = {
+                'put': "INSERT OR REPLACE INTO {} (id, data{}) "
+                       "VALUES (?, ?{})".format(
+                           table, "".join(", " + c for c in columns),
+                           ", ?" * len(columns)),
+                'delete': "DELETE FROM {} WHERE id = ?".format(table),
+                'get': "SELECT data FROM {} WHERE id = ?".format(table),
+                'count': "SELECT COUNT(*) FROM {}".format(table),
+                'all': "SELECT data FROM {}".format(table),
+                'page': "SELECT id, data FROM {} WHERE id > ? "
+                        "ORDER BY id LIMIT ?".format(table),
+            }
+            self._tables[cls.__name__] = sql
+            return sql
+
+    def load(self, cls):
+        """ Make sure the table of a class exists
+        """
+        self._table(cls)
+
+    def save_all(self, cls):
+        """ Nothing to do: every change is committed as it is made
+        """
+        self._table(cls)
+
+    def put(self, obj: TypeVar('Base')):
+        """ Insert or replace an object
+        """
+        cls = obj.__class__
+        values = [obj.id, json.dumps(obj.to_json(True))]
+        for attr in cls.__indexes__:
+            value = getattr(obj, attr, None)
+            values.append(value if type(value) in SQL_TYPES else None)
+        self._connection().execute(self._table(cls)['put'], values)
+
+    def delete(self, obj: TypeVar('Base')):
+        """ Remove an object
+        """
+        self._connection().execute(self._table(obj.__class__)['delete'],
+                                   (obj.id,))
+
+    def count(self, cls) -> int:
+        """ Count all objects of a class
+        """
+        return self._connection().execute(self._table(cls)['count']) \
+            .fetchone()[0]
+
+    def get(self, cls, obj_id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        row = self._connection().execute(self._table(cls)['get'],
+                                         (obj_id,)).fetchone()
+        if row is None:
+            return None
+        return cls(**json.loads(row[0]))
+
+    def iterate(self, cls, after: str = None) -> Iterator[TypeVar('Base')]:
+        """ Yield all objects of a class in ID order, starting after the
+        ID `after`, reading ITERATE_BATCH rows at a time off the primary key
+        """
+        query = self._table(cls)['page']
+        after = "" if after is None else after
+        while True:
+            rows = self._connection().execute(
+                query, (after, ITERATE_BATCH)).fetchall()
+            for obj_id, data in rows:
+                yield cls(**json.loads(data))
+            if len(rows) < ITERATE_BATCH:
+                return
+            after = rows[-1][0]
+
+    def select(self, cls, predicates: list) -> Iterator[TypeVar('Base')]:
+        """ Yield the objects of a class matching all the (attribute,
+        operator, value) predicates, lazily
+
+        Predicates on indexed attributes are pushed down to SQLite, which
+        picks the index to use; rows are decoded ITERATE_BATCH at a time
+        and checked against the remaining predicates.
+        """
+        where, params, rest = [], [], []
+        for predicate in predicates:
+            attr, op, value = predicate
+            clause = None
+            if attr in cls.__indexes__:
+                clause = self._clause('"{}"'.format(attr), op, value)
+            if clause is None:
+                rest.append(predicate)
+                continue
+            where.append(clause[0])
+            params.extend(clause[1])
+            if op in ('prefix', 'gt', 'gte', 'lt', 'lte'):
+                rest.append(predicate)
+        query = self._table(cls)['all']
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        test = self.compile(rest)
+        cursor = self._connection().execute(query, params)
+        while True:
+            rows = cursor.fetchmany(ITERATE_BATCH)
+            if not rows:
+                return
+            for data, in rows:
+                obj = cls(**json.loads(data))
+                if test(obj):
+                    yield obj
+
+    @staticmethod
+    def _clause(column: str, op: str, value) -> tuple:
+        """ SQL condition and parameters of a predicate on a column, or
+        None if SQLite can't answer it exactly like Python would
+
+        Range and prefix conditions only narrow the rows, they are checked
+        again on the objects.
+        """
+        if op == 'eq' and (value is None or type(value) in SQL_TYPES):
+            return "{} IS ?".format(column), [value]
+        if op == 'in':
+            try:
+                values = list(value)
+            except TypeError:
+                return None
+            if not all(type(v) in SQL_TYPES for v in values):
+                return None
+            if not values:
+                return "0", []
+            return "{} IN ({})".format(
+                column, ", ".join("?" * len(values))), values
+        if op == 'prefix' and type(value) is str and value and \
+                ord(value[-1]) < 0xd7ff:
+            upper = value[:-1] + chr(ord(value[-1]) + 1)
+            return "{0} >= ? AND {0} < ?".format(column), [value, upper]
+        if op in ('gt', 'gte', 'lt', 'lte') and type(value) in SQL_TYPES:
+            sql_op = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}[op]
+            return "{} {} ?".format(column, sql_op), [value]
+        return None
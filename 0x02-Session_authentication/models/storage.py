@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+""" Storage module
+"""
+import operator
+from typing import Callable, TypeVar, List, Iterator
+
+
+# Query operators, cheapest to check first
+OPERATORS = ('eq', 'in', 'prefix', 'gt', 'gte', 'lt', 'lte')
+
+
+class Storage():
+    """ Storage interface: where the models keep their objects
+
+    `models.base` picks the backend from DB_BACKEND ("file" or "sqlite");
+    a backend only has to implement the methods below.
+    """
+
+    def load(self, cls):
+        """ Load all objects of a class
+        """
+        raise NotImplementedError
+
+    def save_all(self, cls):
+        """ Persist all objects of a class
+        """
+        raise NotImplementedError
+
+    def put(self, obj: TypeVar('Base')):
+        """ Store an object, replacing the one with the same ID
+        """
+        raise NotImplementedError
+
+    def delete(self, obj: TypeVar('Base')):
+        """ Remove an object
+        """
+        raise NotImplementedError
+
+    def refresh(self, cls):
+        """ Catch up with the changes other processes made to the objects
+        of a class, giving the class a new version if there were any
+
+        Backends that always read from the shared store have nothing to do.
+        """
+
+    def flush(self, cls):
+        """ Write the changes to the objects of a class that the backend
+        still holds in memory
+
+        Backends that persist every change as it is made have nothing to do.
+        """
+
+    def count(self, cls) -> int:
+        """ Count all objects of a class
+        """
+        raise NotImplementedError
+
+    def get(self, cls, obj_id: str) -> TypeVar('Base'):
+        """ Return one object by ID, or None
+        """
+        raise NotImplementedError
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Return all objects of a class with matching attributes
+        """
+        predicates = [(k, 'eq', v) for k, v in attributes.items()]
+        return list(self.select(cls, predicates))
+
+    def select(self, cls, predicates: list) -> Iterator[TypeVar('Base')]:
+        """ Yield the objects of a class matching all the (attribute,
+        operator, value) predicates, lazily
+
+        Backends override this to answer predicates from their indexes.
+        """
+        test = self.compile(predicates)
+        return (obj for obj in self.iterate(cls) if test(obj))
+
+    def iterate(self, cls, after: str = None) -> Iterator[TypeVar('Base')]:
+        """ Yield all objects of a class in ID order, lazily, starting
+        after the ID `after`
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def compile(predicates: list) -> Callable:
+        """ Build a test of all the predicates, cheapest operators first
+        """
+        tests = [_predicate_test(*predicate) for predicate in
+                 sorted(predicates, key=lambda p: OPERATORS.index(p[1]))]
+
+        def test(obj: TypeVar('Base')) -> bool:
+            for predicate_test in tests:
+                if not predicate_test(obj):
+                    return False
+            return True
+        return test
+
+
+def _predicate_test(attr: str, op: str, value) -> Callable:
+    """ Test of one (attribute, operator, value) predicate
+
+    Values of another type than the bound never match a range or prefix.
+    """
+    if op == 'eq':
+        return lambda obj: getattr(obj, attr) == value
+    if op == 'in':
+        try:
+            values = set(value)
+        except TypeError:
+            values = list(value)
+
+        def test_in(obj: TypeVar('Base')) -> bool:
+            try:
+                return getattr(obj, attr) in values
+            except TypeError:
+                return False
+        return test_in
+    if op == 'prefix':
+        def test_prefix(obj: TypeVar('Base')) -> bool:
+            attr_value = getattr(obj, attr)
+            return type(attr_value) is str and attr_value.startswith(value)
+        return test_prefix
+    compare = getattr(operator, 'ge' if op == 'gte' else
+                      'le' if op == 'lte' else op)
+
+    def test_range(obj: TypeVar('Base')) -> bool:
+        try:
+            return compare(getattr(obj, attr), value)
+        except TypeError:
+            return False
+    return test_range
@@ -5,6 +5,8 @@ from models.base import Base
 
 class UserSession(Base):
     """ Implements the user session class"""
+    __indexes__ = ('session_id',)
+    __slots__ = ('user_id', 'session_id')
 
     def __init__(self, *args: list, **kwargs: dict):
         """Initialize UserSession with user_id and session_id"""
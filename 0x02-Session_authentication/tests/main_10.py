@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+""" Main 10: GET /api/v1/users with cold, cached projections and cached body
+"""
+import sys
+import time
+import api.v1.app
+from models.base import storage
+from models.user import User
+
+n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+n_requests = 10
+
+User.load_from_file()
+for i in range(User.count(), n_users):
+    storage.put(User(email="user{}@hbtn.io".format(i)))
+api.v1.app.auth = None
+client = api.v1.app.app.test_client()
+
+
+def timed(before_request=None):
+    """ Average time of a GET /api/v1/users, in seconds """
+    elapsed = 0
+    for i in range(n_requests):
+        if before_request is not None:
+            before_request()
+        start = time.perf_counter()
+        body = client.get('/api/v1/users').data
+        elapsed += time.perf_counter() - start
+    return elapsed / n_requests, body
+
+
+cold, body = timed(User.load_from_file)
+projections, _ = timed(User._changed)
+cached, cached_body = timed()
+
+print("{} users, {} bytes, same body: {}".format(User.count(), len(body),
+                                                 body == cached_body))
+print("fresh objects: {:.1f} ms per request".format(cold * 1000))
+print("cached to_json: {:.1f} ms per request ({:.1f}x)".format(
+    projections * 1000, cold / projections))
+print("cached body: {:.2f} ms per request ({:.0f}x)".format(
+    cached * 1000, cold / cached))
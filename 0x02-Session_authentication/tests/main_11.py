@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+""" Main 11: peak memory of GET /api/v1/users, full list vs NDJSON stream
+"""
+import sys
+import time
+import tracemalloc
+import api.v1.app
+from models.base import storage
+from models.user import User
+
+n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+User.load_from_file()
+for i in range(User.count(), n_users):
+    storage.put(User(email="user{}@hbtn.io".format(i)))
+api.v1.app.auth = None
+client = api.v1.app.app.test_client()
+
+for label, url in (("full list", '/api/v1/users'),
+                   ("ndjson", '/api/v1/users?format=ndjson'),
+                   ("page of 100", '/api/v1/users?limit=100')):
+    User._changed()
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get(url, buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("{}: {} bytes in {:.2f}s, peak {:.1f} MB".format(
+        label, size, elapsed, peak / 2 ** 20))
+
+for limit in ("0", "-1", "abc", "²"):
+    print("limit={}: {}".format(limit, client.get(
+        '/api/v1/users', query_string={'limit': limit}).status_code))
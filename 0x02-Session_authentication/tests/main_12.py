@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+""" Main 12: lookups through Base.search vs the lazy query layer
+"""
+import sys
+import time
+from models.base import storage
+from models.user import User
+
+n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+n_queries = 20
+
+User.load_from_file()
+for i in range(User.count(), n_users):
+    storage.put(User(email="user{}@hbtn.io".format(i),
+                     first_name="First{}".format(i % 100)))
+emails = ["user{}@hbtn.io".format(i)
+          for i in range(0, n_users, max(1, n_users // n_queries))]
+
+
+def timed(label, func):
+    """ Print the average time of func(email) over the sample emails """
+    start = time.perf_counter()
+    for email in emails:
+        func(email)
+    elapsed = (time.perf_counter() - start) / len(emails)
+    print("{}: {:.3f} ms per query".format(label, elapsed * 1000))
+
+
+timed("search, first match",
+      lambda email: User.search({'first_name': "First7"})[0])
+timed("query, first()",
+      lambda email: User.query(first_name="First7").first())
+timed("scan, 10 by prefix",
+      lambda email: [user for user in User.all()
+                     if user.email.startswith(email[:6])][:10])
+timed("query, 10 by prefix",
+      lambda email: User.query(email__prefix=email[:6]).limit(10).all())
+timed("search, email and first_name",
+      lambda email: User.search({'first_name': "First7", 'email': email}))
+timed("query, email and first_name",
+      lambda email: User.query(first_name="First7", email=email).all())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+""" Main 13: multi-threaded create/get/search throughput, 1 shard vs N
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+n_shards = sys.argv[1] if len(sys.argv) > 1 else "8"
+models_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+probe = """
+import threading, time
+from models.user import User
+
+N_THREADS = 16
+N_OPS = 500
+User.load_from_file()
+
+
+def worker(n, results):
+    start = time.perf_counter()
+    ids = []
+    for i in range(N_OPS):
+        user = User(email="bench{}_{}@hbtn.io".format(n, i))
+        user.save()
+        ids.append(user.id)
+    created = time.perf_counter()
+    for user_id in ids:
+        assert User.get(user_id) is not None
+    got = time.perf_counter()
+    for i in range(N_OPS):
+        User.query(email="bench{}_{}@hbtn.io".format(n, i)).first()
+    results.append((created - start, got - created,
+                    time.perf_counter() - got))
+
+
+results = []
+start = time.perf_counter()
+threads = [threading.Thread(target=worker, args=(n, results))
+           for n in range(N_THREADS)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+wall = time.perf_counter() - start
+n_ops = N_THREADS * N_OPS
+print("create {:.0f}/s, get {:.0f}/s, search {:.0f}/s, wall {:.2f}s".format(
+    *(n_ops / max(r[k] for r in results) for k in range(3)), wall))
+"""
+for label, shards in (("1 shard", "1"),
+                      ("{} shards".format(n_shards), n_shards)):
+    work_dir = tempfile.mkdtemp()
+    env = dict(os.environ, DB_SHARDS=shards, PYTHONPATH=models_dir)
+    out = subprocess.run([sys.executable, "-c", probe], cwd=work_dir,
+                         env=env, stdout=subprocess.PIPE)
+    print("{}: {}".format(label, out.stdout.decode().strip()))
+    shutil.rmtree(work_dir)
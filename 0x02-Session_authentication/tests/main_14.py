@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+""" Main 14: save/load time and size of a User snapshot, JSON vs binary
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+models_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+probe = """
+import os, sys, time
+from models.file_storage import DATA, FORMAT
+from models.user import User
+
+users = {}
+for i in range(int(sys.argv[1])):
+    user = User(email="user{}@hbtn.io".format(i), first_name="First",
+                _password="0" * 64)
+    users[user.id] = user
+DATA['User'] = users
+
+start = time.perf_counter()
+User.save_to_file()
+save = time.perf_counter() - start
+size = os.path.getsize(".db_User.{}".format(FORMAT))
+del users, DATA['User']
+
+start = time.perf_counter()
+User.load_from_file()
+load = time.perf_counter() - start
+print("save {:.2f}s, load {:.2f}s, {:.1f} MB, {} users".format(
+    save, load, size / 2 ** 20, User.count()))
+"""
+for db_format in ("json", "jsonl", "bin"):
+    work_dir = tempfile.mkdtemp()
+    env = dict(os.environ, DB_FORMAT=db_format, DB_LAZY="0",
+               PYTHONPATH=models_dir)
+    out = subprocess.run([sys.executable, "-c", probe, str(n_users)],
+                         cwd=work_dir, env=env, stdout=subprocess.PIPE)
+    print("{}: {}".format(db_format, out.stdout.decode().strip()))
+    shutil.rmtree(work_dir)
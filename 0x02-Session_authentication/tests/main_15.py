@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+""" Main 15: crash injection and write latency for each DB_FSYNC level
+
+Usage: ./main_15.py [n_crashes] [budget_ms]
+A writer process is killed at random points, in the middle of journal
+appends and snapshots; the store must always load, with every save the
+writer reported. The p99 latency of a save must stay within budget_ms
+(default 25).
+"""
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+n_crashes = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+budget_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 25
+models_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+writer = """
+import sys
+from models.user import User
+
+User.load_from_file()
+i = User.count()
+while True:
+    User(email="crash{}@hbtn.io".format(i), _password="0" * 64).save()
+    i += 1
+    print(i, flush=True)
+    if i % 500 == 0:
+        User.save_to_file()
+"""
+
+checker = """
+import os
+from models.user import User
+
+User.load_from_file()
+temps = [name for name in os.listdir('.') if name.endswith('.tmp')]
+print(User.count(), len(temps))
+"""
+
+aborter = """
+from models.base import storage
+from models.user import User
+
+
+def crash(key, f):
+    f.write(b"half a snapshot")
+    raise KeyboardInterrupt
+
+
+User.load_from_file()
+for i in range(100):
+    User(email="abort{}@hbtn.io".format(i)).save()
+User.save_to_file()
+storage._write_snapshot = crash
+try:
+    User.save_to_file()
+except KeyboardInterrupt:
+    pass
+User.load_from_file()
+print(User.count())
+"""
+
+timer = """
+import time
+from models.user import User
+
+User.load_from_file()
+times = []
+for i in range(2000):
+    user = User(email="latency{}@hbtn.io".format(i))
+    start = time.perf_counter()
+    user.save()
+    times.append(time.perf_counter() - start)
+times.sort()
+start = time.perf_counter()
+User.save_to_file()
+print("{:.3f} {:.3f} {:.1f}".format(
+    times[len(times) // 2] * 1000, times[len(times) * 99 // 100] * 1000,
+    (time.perf_counter() - start) * 1000))
+"""
+
+
+def run(code, work_dir, env):
+    """ Run code in a fresh interpreter and return its output """
+    out = subprocess.run([sys.executable, "-c", code], cwd=work_dir, env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if out.returncode != 0:
+        return "error: " + out.stderr.decode().strip().splitlines()[-1]
+    return out.stdout.decode().strip()
+
+
+for level in ("always", "interval", "never"):
+    env = dict(os.environ, DB_FSYNC=level, DB_JOURNAL_COMPACT_EVERY="200",
+               PYTHONPATH=models_dir)
+    work_dir = tempfile.mkdtemp()
+    lost = failed = 0
+    for _ in range(n_crashes):
+        proc = subprocess.Popen([sys.executable, "-c", writer], cwd=work_dir,
+                                env=env, stdout=subprocess.PIPE)
+        time.sleep(random.uniform(0.5, 1.5))
+        os.kill(proc.pid, signal.SIGKILL)
+        lines = proc.stdout.read().split()
+        proc.wait()
+        acked = int(lines[-1]) if lines else 0
+        result = run(checker, work_dir, env)
+        if result.startswith("error"):
+            failed += 1
+            continue
+        count, temps = map(int, result.split())
+        if count < acked or temps:
+            lost += 1
+    print("{}: {} crashes, {} failed loads, {} lost saves".format(
+        level, n_crashes, failed, lost))
+    shutil.rmtree(work_dir)
+
+    work_dir = tempfile.mkdtemp()
+    print("{}: aborted snapshot, reloaded {} / 100 users".format(
+        level, run(aborter, work_dir, env)))
+    shutil.rmtree(work_dir)
+
+    work_dir = tempfile.mkdtemp()
+    p50, p99, snapshot = map(float, run(timer, work_dir, env).split())
+    print("{}: save p50 {:.3f} ms, p99 {:.3f} ms ({}), snapshot {:.1f} ms"
+          .format(level, p50, p99,
+                  "ok" if p99 <= budget_ms else "over budget", snapshot))
+    shutil.rmtree(work_dir)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+""" Main 16: several processes sharing one file store, with and without
+DB_SHARED
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+n_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+models_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+worker = """
+import sys
+from models.user import User
+
+n = sys.argv[1]
+User.load_from_file()
+for i in range(500):
+    user = User(email="worker{}_{}@hbtn.io".format(n, i))
+    user.save()
+    if i % 2:
+        user.first_name = "updated"
+        user.save()
+    if i % 100 == 99:
+        User.save_to_file()
+    User.search({'email': "worker0_0@hbtn.io"})
+"""
+
+forker = """
+import os, sys
+from models.user import User
+
+User.load_from_file()
+children = []
+for n in range(int(sys.argv[1])):
+    pid = os.fork()
+    if pid == 0:
+        for i in range(500):
+            User(email="child{}_{}@hbtn.io".format(n, i)).save()
+            if i % 100 == 99:
+                User.save_to_file()
+        os._exit(0)
+    children.append(pid)
+for pid in children:
+    os.waitpid(pid, 0)
+"""
+
+checker = """
+from models.user import User
+
+User.load_from_file()
+print(User.count(), len(User.search({'first_name': "updated"})))
+"""
+
+catch_up = """
+import subprocess, sys, time
+from models.user import User
+
+for i in range(100000):
+    User(email="user{}@hbtn.io".format(i)).save()
+User.save_to_file()
+User.load_from_file()
+user_id = User.all()[0].id
+
+start = time.perf_counter()
+for _ in range(100000):
+    User.get(user_id)
+unchanged = (time.perf_counter() - start) * 10
+
+subprocess.run([sys.executable, "-c", "from models.user import User\\n"
+                "for i in range(10): User(email='new{}'.format(i)).save()"])
+start = time.perf_counter()
+count = User.count()
+tail = (time.perf_counter() - start) * 1000
+
+start = time.perf_counter()
+User.load_from_file()
+full = (time.perf_counter() - start) * 1000
+print("get {:.2f} us, 10 new users picked up in {:.2f} ms ({} users), "
+      "full reload {:.0f} ms".format(unchanged, tail, count, full))
+"""
+
+view = """
+import subprocess, sys
+import api.v1.app
+from api.v1.app import app
+
+api.v1.app.auth = None
+client = app.test_client()
+before = len(client.get("/api/v1/users").get_json())
+subprocess.run([sys.executable, "-c", "from models.user import User\\n"
+                "User(email='other@hbtn.io').save()"])
+after = len(client.get("/api/v1/users").get_json())
+print("GET /api/v1/users: {} users, then {}".format(before, after))
+"""
+
+
+def run(code, work_dir, env, *args):
+    """ Start code in a fresh interpreter """
+    return subprocess.Popen([sys.executable, "-c", code] + list(args),
+                            cwd=work_dir, env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL)
+
+
+for shared in ("0", "1"):
+    env = dict(os.environ, DB_SHARED=shared, PYTHONPATH=models_dir)
+    work_dir = tempfile.mkdtemp()
+    workers = [run(worker, work_dir, env, str(n)) for n in range(n_workers)]
+    failed = sum(proc.wait() != 0 for proc in workers)
+    count, updated = run(checker, work_dir, env).communicate()[0].split()
+    print("DB_SHARED={}: {} / {} users, {} / {} updates kept, "
+          "{} workers failed".format(shared, int(count), 500 * n_workers,
+                                     int(updated), 250 * n_workers, failed))
+    shutil.rmtree(work_dir)
+
+    work_dir = tempfile.mkdtemp()
+    run(forker, work_dir, env, str(n_workers)).wait()
+    count, _ = run(checker, work_dir, env).communicate()[0].split()
+    print("DB_SHARED={}: forked after load, {} / {} users".format(
+        shared, int(count), 500 * n_workers))
+    shutil.rmtree(work_dir)
+
+    for code in (catch_up, view):
+        work_dir = tempfile.mkdtemp()
+        out = run(code, work_dir, env).communicate()[0]
+        print("DB_SHARED={}: {}".format(shared, out.decode().strip()))
+        shutil.rmtree(work_dir)
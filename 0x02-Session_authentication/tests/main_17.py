@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+""" Main 17: a store written with one DB_FORMAT/DB_LAZY/DB_SHARDS setting,
+then loaded with another
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+models_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+writer = """
+from models.user import User
+
+for i in range(3):
+    User(email="user{}@hbtn.io".format(i)).save()
+User.save_to_file()
+User(email="journaled@hbtn.io").save()
+"""
+
+reader = """
+import os
+from models.user import User
+
+User.load_from_file()
+print(User.count(), len(User.search({'email': "user1@hbtn.io"})),
+      sorted(name for name in os.listdir('.') if name.startswith('.db_')))
+"""
+
+settings = [
+    ({}, {'DB_LAZY': "1"}),
+    ({'DB_LAZY': "1"}, {}),
+    ({'DB_FORMAT': "jsonl"}, {'DB_SHARDS': "4"}),
+    ({}, {'DB_FORMAT': "bin"}),
+    ({'DB_FORMAT': "bin", 'DB_SHARDS': "2"}, {'DB_LAZY': "1"}),
+]
+for before, after in settings:
+    work_dir = tempfile.mkdtemp()
+    for code, setting in ((writer, before), (reader, after), (reader, after)):
+        env = dict(os.environ, PYTHONPATH=models_dir, **setting)
+        out = subprocess.run([sys.executable, "-c", code], cwd=work_dir,
+                             env=env, stdout=subprocess.PIPE)
+    print("{} -> {}: {}".format(before, after, out.stdout.decode().strip()))
+    shutil.rmtree(work_dir)
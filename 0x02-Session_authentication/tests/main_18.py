@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+""" Main 18: DB_WRITE_BEHIND with snapshots failing for a while, and
+flushed on demand
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+models_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+failing = """
+import time
+from models import file_storage
+from models.base import storage
+from models.user import User
+
+write_snapshot = storage._write_snapshot
+failures = [3]
+
+
+def disk_full(key, f):
+    if failures[0]:
+        failures[0] -= 1
+        raise OSError(28, "No space left on device")
+    write_snapshot(key, f)
+
+
+storage._write_snapshot = disk_full
+for i in range(10):
+    User(email="user{}@hbtn.io".format(i)).save()
+time.sleep(0.5)
+print(file_storage._flusher.is_alive(), sorted(file_storage.DIRTY))
+"""
+
+flusher = """
+import os
+from models.user import User
+
+User(email="flushed@hbtn.io").save()
+before = os.path.exists(".db_User.json")
+User.flush()
+print(before, os.path.exists(".db_User.json"))
+"""
+
+checker = """
+import os
+from models.user import User
+
+User.load_from_file()
+print(User.count(), os.path.getsize(".db_User.json") > 2)
+"""
+
+env = dict(os.environ, DB_WRITE_BEHIND="1", DB_FLUSH_INTERVAL_MS="20",
+           PYTHONPATH=models_dir)
+work_dir = tempfile.mkdtemp()
+for code in (failing, checker):
+    out = subprocess.run([sys.executable, "-c", code], cwd=work_dir, env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    print(out.stdout.decode().strip())
+shutil.rmtree(work_dir)
+
+env['DB_FLUSH_INTERVAL_MS'] = "60000"
+work_dir = tempfile.mkdtemp()
+for code in (flusher, checker):
+    out = subprocess.run([sys.executable, "-c", code], cwd=work_dir, env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    print(out.stdout.decode().strip())
+shutil.rmtree(work_dir)
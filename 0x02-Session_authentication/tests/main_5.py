@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+""" Main 5: User.search by email, full scan vs secondary index
+"""
+import sys
+import time
+from models.base import storage
+from models.file_storage import DATA, INDEXES
+from models.user import User
+
+n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+DATA['User'] = {}
+for i in range(n_users):
+    user = User(email="user{}@hbtn.io".format(i))
+    DATA['User'][user.id] = user
+
+emails = ["user{}@hbtn.io".format(i)
+          for i in range(0, n_users, max(1, n_users // 20))]
+
+# without declared indexes, search can't build one on first use: it scans
+INDEXES.pop('User', None)
+indexes, User.__indexes__ = User.__indexes__, ()
+start = time.perf_counter()
+for email in emails:
+    assert len(User.search({'email': email})) == 1
+scan = (time.perf_counter() - start) / len(emails)
+User.__indexes__ = indexes
+print("scan: {:.3f} ms per lookup".format(scan * 1000))
+
+start = time.perf_counter()
+storage.reindex(User)
+print("index built in {:.2f}s".format(time.perf_counter() - start))
+
+start = time.perf_counter()
+for email in emails:
+    assert len(User.search({'email': email})) == 1
+indexed = (time.perf_counter() - start) / len(emails)
+print("indexed: {:.3f} ms per lookup ({:.0f}x)".format(
+    indexed * 1000, scan / indexed))
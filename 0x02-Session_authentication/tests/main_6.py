@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+""" Main 6: concurrent save/search/remove on the model store
+"""
+import threading
+from models.user import User
+
+N_THREADS = 16
+N_OPS = 300
+
+User.load_from_file()
+start_count = User.count()
+errors = []
+
+
+def worker(n):
+    """ Create, look up, update and delete users """
+    try:
+        kept = []
+        for i in range(N_OPS):
+            user = User()
+            user.email = "stress{}_{}@hbtn.io".format(n, i)
+            user.save()
+            found = User.search({'email': user.email})
+            assert len(found) == 1 and found[0].id == user.id
+            User.all()
+            if i % 2:
+                user.remove()
+            else:
+                kept.append(user)
+        for user in kept:
+            user.first_name = "kept"
+            user.save()
+    except Exception as e:
+        errors.append(e)
+
+
+threads = [threading.Thread(target=worker, args=(n,))
+           for n in range(N_THREADS)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+
+expected = start_count + N_THREADS * N_OPS // 2
+print("errors: {}".format(errors))
+print("in memory: {} / {}".format(User.count(), expected))
+User.load_from_file()
+print("reloaded: {} / {}".format(User.count(), expected))
+print("kept: {}".format(len(User.search({'first_name': 'kept'}))))
+
+user = User(email="stale@hbtn.io")
+user.save()
+user.email = "renamed@hbtn.io"
+print("unsaved rename, found by old email: {}".format(
+    len(User.search({'email': "stale@hbtn.io"}))))
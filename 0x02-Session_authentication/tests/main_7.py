@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+""" Main 7: startup time and RSS of User.load_from_file, eager vs lazy,
+then of updating users with lazy loading
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import uuid
+
+n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+models_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+work_dir = tempfile.mkdtemp()
+
+with open(os.path.join(work_dir, ".db_User.jsonl"), 'w') as f:
+    for i in range(n_users):
+        f.write(json.dumps({
+            "id": str(uuid.uuid4()),
+            "created_at": "2024-01-01T00:00:00",
+            "updated_at": "2024-01-01T00:00:00",
+            "email": "user{}@hbtn.io".format(i),
+            "_password": "0" * 64,
+            "first_name": None,
+            "last_name": None}) + "\n")
+
+probe = """
+import resource, time
+start = time.perf_counter()
+from models.user import User
+User.load_from_file()
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+print("{} users, startup {:.2f}s, max RSS {} MB".format(User.count(), elapsed,
+                                                      rss))
+"""
+for label, lazy in (("eager", "0"), ("lazy", "1")):
+    env = dict(os.environ, DB_FORMAT="jsonl", DB_LAZY=lazy,
+               PYTHONPATH=models_dir)
+    out = subprocess.run([sys.executable, "-c", probe], cwd=work_dir,
+                         env=env, stdout=subprocess.PIPE)
+    print("{}: {}".format(label, out.stdout.decode().strip()))
+
+updater = """
+import resource, sys
+from itertools import islice
+from models.file_storage import DATA
+from models.user import User
+
+User.load_from_file()
+ids = [user.id for user in islice(User.iterate(), int(sys.argv[1]))]
+held = 0
+for user_id in ids:
+    user = User.get(user_id)
+    user.first_name = "updated"
+    user.save()
+    held = max(held, DATA['User'].changed_count())
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+print("{} users updated, at most {} held in memory, max RSS {} MB".format(
+    len(ids), held, rss))
+"""
+env = dict(os.environ, DB_FORMAT="jsonl", DB_LAZY="1", PYTHONPATH=models_dir)
+out = subprocess.run([sys.executable, "-c", updater, str(n_users // 2)],
+                     cwd=work_dir, env=env, stdout=subprocess.PIPE)
+print("lazy: {}".format(out.stdout.decode().strip()))
+
+shutil.rmtree(work_dir)
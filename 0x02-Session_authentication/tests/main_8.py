@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+""" Main 8: bytes per User / UserSession, __dict__ vs __slots__
+"""
+import sys
+import tracemalloc
+import uuid
+from datetime import datetime
+from models.user import User
+from models.user_session import UserSession
+
+
+class DictUser():
+    """ User with a per-instance __dict__, as before __slots__ """
+
+    def __init__(self, **kwargs):
+        self.id = str(uuid.uuid4())
+        self.created_at = datetime.utcnow()
+        self.updated_at = datetime.utcnow()
+        self.email = kwargs.get('email')
+        self._password = kwargs.get('_password')
+        self.first_name = kwargs.get('first_name')
+        self.last_name = kwargs.get('last_name')
+
+
+class DictUserSession():
+    """ UserSession with a per-instance __dict__, as before __slots__ """
+
+    def __init__(self, **kwargs):
+        self.id = str(uuid.uuid4())
+        self.created_at = datetime.utcnow()
+        self.updated_at = datetime.utcnow()
+        self.user_id = kwargs.get('user_id')
+        self.session_id = kwargs.get('session_id')
+
+
+def bytes_per_object(make, n):
+    """ Average memory held by one object built by `make` """
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    objs = [make(i) for i in range(n)]
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del objs
+    return size / n
+
+
+n_objs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+email = "bob@hbtn.io"
+user_id = str(uuid.uuid4())
+for label, before, after, kwargs in (
+        ("User", DictUser, User,
+         {'email': email, '_password': "x" * 64, 'first_name': "Bob"}),
+        ("UserSession", DictUserSession, UserSession,
+         {'user_id': user_id, 'session_id': user_id})):
+    dict_size = bytes_per_object(lambda i: before(**kwargs), n_objs)
+    slots_size = bytes_per_object(lambda i: after(**kwargs), n_objs)
+    print("{}: {:.0f} bytes before, {:.0f} bytes after ({:.0f}% less)".format(
+        label, dict_size, slots_size, 100 * (1 - slots_size / dict_size)))
+
+user = User(email=email, first_name="Bob")
+user.password = "pwd"
+print(sorted(user.to_json()))
+print(sorted(user.to_json(True)))
+print(User(**user.to_json(True)) == user, user.is_valid_password("pwd"))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+""" Main 9: User load/serialize throughput, strptime/strftime vs fast codec
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+import models.base
+from models.base import TIMESTAMP_FORMAT
+from models.user import User
+
+
+def legacy_parse(value):
+    """ strptime, as before """
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def legacy_format(value):
+    """ strftime, as before """
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+epoch = datetime(2024, 1, 1)
+records = []
+for i in range(n_users):
+    stamp = (epoch + timedelta(seconds=i)).strftime(TIMESTAMP_FORMAT)
+    records.append({'id': str(i), 'created_at': stamp, 'updated_at': stamp,
+                    'email': "user{}@hbtn.io".format(i)})
+
+results = {}
+for label, parse, fmt in (
+        ("before", legacy_parse, legacy_format),
+        ("after", models.base.parse_timestamp, models.base.format_timestamp)):
+    models.base.parse_timestamp = parse
+    models.base.format_timestamp = fmt
+
+    start = time.perf_counter()
+    users = [User(**record) for record in records]
+    load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results[label] = [user.to_json() for user in users]
+    serialize = time.perf_counter() - start
+    print("{}: load {:.0f} users/sec, serialize {:.0f} users/sec".format(
+        label, n_users / load, n_users / serialize))
+
+print("identical output: {}".format(results["before"] == results["after"]))
+
+# only what strptime accepts: no offsets, week dates or other separators
+for value in ('2024-01-01T00:00+01', '2024-W01-1T00:00:00',
+              '2024-01-01 00:00:00', '2024-13-01T00:00:00'):
+    try:
+        models.base.parse_timestamp(value)
+        print("{}: accepted".format(value))
+    except ValueError:
+        print("{}: ValueError".format(value))
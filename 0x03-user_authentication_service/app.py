@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 """flask app"""
 from flask import Flask, jsonify, request, abort, redirect
-from auth import Auth
+from auth import Auth, HashingBusy
 
 
 AUTH = Auth()
 app = Flask(__name__)
 
 
+@app.errorhandler(HashingBusy)
+def hashing_busy(error) -> str:
+    """too many passwords waiting to be hashed"""
+    response = jsonify({"message": "server busy, retry later"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
 @app.route("/", methods=['GET'], strict_slashes=False)
 def Bienvenue() -> str:
     """welcome route"""
@@ -82,4 +90,4 @@ def update_password() -> str:
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port="5000")
+    app.run(host="0.0.0.0", port="5000", threaded=True)
@@ -1,18 +1,27 @@
 #!/usr/bin/env python3
 """Contain Auth class that interact with the authentication database
 """
-import bcrypt
+import multiprocessing
+import os
+import threading
 import uuid
-from typing import Union
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Union
 from sqlalchemy.orm.exc import NoResultFound
 from db import DB
+from encrypt_password import (current_rounds, hash_password, is_valid,
+                              needs_rehash)
 from user import User
 
 
+HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", os.cpu_count() or 1))
+HASH_QUEUE_DEPTH = int(os.environ.get("AUTH_HASH_QUEUE_DEPTH", 64))
+
+
 def _hash_password(password: str) -> bytes:
-    """Hashes a password using bcrypt
+    """Hashes a password using bcrypt at the calibrated cost
     """
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return hash_password(password)
 
 
 def _generate_uuid() -> str:
@@ -21,12 +30,65 @@ def _generate_uuid() -> str:
     return str(uuid.uuid4())
 
 
+class HashingBusy(Exception):
+    """Raised when the password hashing pool has no room for more work
+    """
+
+
+class HashingPool:
+    """Process pool running bcrypt outside the request threads
+
+    At most `depth` hashes are queued or running at once; past that,
+    submissions fail with HashingBusy instead of piling up.
+
+    The workers are forked when the pool is created, with Auth at startup:
+    forked later, from a request thread, a child could inherit locks held
+    by the process's other threads. Forking is explicit, as the spawn and
+    forkserver methods would import the app again in every worker.
+    """
+    def __init__(self, workers: int = HASH_WORKERS,
+                 depth: int = HASH_QUEUE_DEPTH):
+        """Initialize the pool and fork its worker processes"""
+        self._slots = threading.BoundedSemaphore(depth)
+        context = None
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        self._executor = ProcessPoolExecutor(workers, mp_context=context)
+        # a forking pool starts all its workers with its first task
+        self._executor.submit(os.getpid).result()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Schedule fn(*args) on a worker process
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn: Callable, *args):
+        """Run fn(*args) on a worker process and wait for its result
+        """
+        return self.submit(fn, *args).result()
+
+
 class Auth:
     """Define Auth class to interact with the authentication database
     """
     def __init__(self):
         """Initialize a new instance of the database"""
         self._db = DB()
+        self._hashing = HashingPool()
+        current_rounds()
+
+    def _hash(self, password: str) -> bytes:
+        """Hash a password on the hashing pool at the calibrated cost
+        """
+        return self._hashing.run(hash_password, password, current_rounds())
 
     def register_user(self, email: str, password: str) -> User:
         """Register new user using provided email and password
@@ -34,7 +96,7 @@ class Auth:
         try:
             self._db.find_user_by(email=email)
         except NoResultFound:
-            user = self._db.add_user(email, _hash_password(password))
+            user = self._db.add_user(email, self._hash(password))
         else:
             raise ValueError()
         return user
@@ -46,7 +108,15 @@ class Auth:
             user = self._db.find_user_by(email=email)
         except NoResultFound:
             return False
-        return bcrypt.checkpw(password.encode('utf-8'), user.hashed_password)
+        valid = self._hashing.run(is_valid, user.hashed_password, password)
+        if valid and needs_rehash(user.hashed_password):
+            try:
+                hashed_password = self._hash(password)
+            except HashingBusy:
+                # the password is verified; rehash on a later login
+                return valid
+            self._db.update_user(user.id, hashed_password=hashed_password)
+        return valid
 
     def create_session(self, email: str) -> str:
         """Create new session for user identified by email
@@ -95,5 +165,5 @@ class Auth:
         except NoResultFound:
             raise ValueError()
         self._db.update_user(user.id,
-                             hashed_password=_hash_password(password),
+                             hashed_password=self._hash(password),
                              reset_token=None)
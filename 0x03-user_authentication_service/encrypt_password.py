@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Encrypting passwords using bcrypt.
+
+The bcrypt cost is calibrated once per process so that one hash takes
+about BCRYPT_TARGET_MS milliseconds (250 by default) on the current
+hardware. Setting BCRYPT_ROUNDS pins the cost instead.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Tuple, Union
+import bcrypt
+
+
+TARGET_MS = float(os.environ.get("BCRYPT_TARGET_MS", 250))
+MIN_ROUNDS = 10
+MAX_ROUNDS = 20
+_rounds = None
+
+
+def calibrate_rounds(target_ms: float = TARGET_MS) -> int:
+    """
+    Finds the highest bcrypt cost whose hashing time fits a latency budget.
+
+    A cheap hash is timed, then the time is doubled for each extra round,
+    since every round doubles the work.
+
+    Args:
+        target_ms (float): The latency budget of one hash, in milliseconds.
+
+    Returns:
+        int: The bcrypt cost, between MIN_ROUNDS and MAX_ROUNDS.
+    """
+    rounds = 8
+    salt = bcrypt.gensalt(rounds)
+    elapsed = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", salt)
+        elapsed = min(elapsed, (time.perf_counter() - start) * 1000)
+    while rounds < MAX_ROUNDS and elapsed * 2 <= target_ms:
+        elapsed *= 2
+        rounds += 1
+    return max(MIN_ROUNDS, rounds)
+
+
+def current_rounds() -> int:
+    """
+    Returns the bcrypt cost of the current policy, calibrating it on the
+    first call unless BCRYPT_ROUNDS is set.
+
+    Returns:
+        int: The bcrypt cost new hashes are made with.
+    """
+    global _rounds
+    if _rounds is None:
+        pinned = os.environ.get("BCRYPT_ROUNDS")
+        _rounds = int(pinned) if pinned else calibrate_rounds()
+    return _rounds
+
+
+def hash_password(password: str, rounds: int = None) -> bytes:
+    """
+    Hashes a password using bcrypt and returns the salted,
+    hashed password as a byte string.
+
+    Args:
+        password (str): The plain text password to be hashed.
+        rounds (int): The bcrypt cost, the current policy's by default.
+
+    Returns:
+        bytes: The salted, hashed password.
+    """
+    encoded_password = password.encode()
+    salt = bcrypt.gensalt(rounds or current_rounds())
+    hashed_password = bcrypt.hashpw(encoded_password, salt)
+
+    return hashed_password
+
+
+def needs_rehash(hashed_password: Union[bytes, str]) -> bool:
+    """
+    Tells whether a stored hash was made with another cost than the
+    current policy.
+
+    Args:
+        hashed_password (bytes): A bcrypt hash, e.g. b"$2b$12$...".
+
+    Returns:
+        bool: True if the password should be hashed again.
+    """
+    if isinstance(hashed_password, str):
+        hashed_password = hashed_password.encode()
+    try:
+        rounds = int(hashed_password.split(b"$")[2])
+    except (IndexError, ValueError):
+        return True
+    return rounds != current_rounds()
+
+
+def is_valid(hashed_password: bytes, password: str,
+             check_rehash: bool = False) -> Union[bool, Tuple[bool, bool]]:
+    """
+    Validates that a given password matches the stored hashed password.
+
+    Args:
+        hashed_password (bytes): The hashed password to compare against.
+        password (str): The plain text password to validate.
+        check_rehash (bool): Also report whether the hash needs rehashing.
+
+    Returns:
+        bool: True if password match hashed password, else False.
+        With check_rehash, a (valid, needs_rehash) tuple instead.
+    """
+    if isinstance(hashed_password, str):
+        hashed_password = hashed_password.encode()
+    encoded_password = password.encode()
+    valid = bcrypt.checkpw(encoded_password, hashed_password)
+    if check_rehash:
+        return valid, valid and needs_rehash(hashed_password)
+    return valid
+
+
+def _verify_chunk(pairs: List[Tuple[bytes, str]]) -> List[bool]:
+    """
+    Worker: validates a chunk of (hashed_password, password) pairs.
+    """
+    return [is_valid(hashed_password, password)
+            for hashed_password, password in pairs]
+
+
+def _hash_chunk(passwords: List[str], rounds: int) -> List[bytes]:
+    """
+    Worker: hashes a chunk of passwords at the given cost.
+    """
+    return [hash_password(password, rounds) for password in passwords]
+
+
+def _run_chunked(worker: Callable, items: Iterable, args: tuple,
+                 workers: int, chunk_size: int, stats: dict) -> Iterator:
+    """
+    Feeds `items` to `worker` in chunks across a process pool and yields
+    the results in input order.
+
+    At most two chunks per process are in flight, so `items` is consumed
+    lazily and memory stays bounded.
+    """
+    workers = workers or os.cpu_count() or 1
+    items = iter(items)
+    start = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(islice(items, chunk_size))
+                if not chunk:
+                    break
+                pending.append(executor.submit(worker, chunk, *args))
+            if not pending:
+                break
+            results = pending.popleft().result()
+            done += len(results)
+            if stats is not None:
+                seconds = time.perf_counter() - start
+                stats.update(items=done, seconds=seconds,
+                             items_per_sec=done / seconds if seconds else 0.0)
+            yield from results
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]], workers: int = None,
+                chunk_size: int = 64, stats: dict = None) -> Iterator[bool]:
+    """
+    Validates many passwords against their hashes on all cores.
+
+    Args:
+        pairs (Iterable[Tuple[bytes, str]]): (hashed_password, password)
+            pairs, consumed lazily.
+        workers (int): Number of processes, the CPU count by default.
+        chunk_size (int): Pairs sent to a process at once.
+        stats (dict): Updated after each chunk with `items`, `seconds`
+            and `items_per_sec`.
+
+    Returns:
+        Iterator[bool]: is_valid() of each pair, in input order.
+    """
+    return _run_chunked(_verify_chunk, pairs, (), workers, chunk_size, stats)
+
+
+def hash_many(passwords: Iterable[str], workers: int = None,
+              chunk_size: int = 64, rounds: int = None,
+              stats: dict = None) -> Iterator[bytes]:
+    """
+    Hashes many passwords on all cores, e.g. to move accounts to bcrypt.
+
+    Args:
+        passwords (Iterable[str]): Plain text passwords, consumed lazily.
+        workers (int): Number of processes, the CPU count by default.
+        chunk_size (int): Passwords sent to a process at once.
+        rounds (int): The bcrypt cost, the current policy's by default.
+        stats (dict): Updated after each chunk with `items`, `seconds`
+            and `items_per_sec`.
+
+    Returns:
+        Iterator[bytes]: The hash of each password, in input order.
+    """
+    return _run_chunked(_hash_chunk, passwords, (rounds or current_rounds(),),
+                        workers, chunk_size, stats)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Main file: the hashing pool, rehash on login and the busy path
+"""
+import encrypt_password
+from app import AUTH, app
+from auth import HashingBusy, HashingPool
+
+email = 'bob@bob.com'
+password = 'MyPwdOfBob'
+
+
+def cost() -> str:
+    """bcrypt cost of Bob's stored hash"""
+    return AUTH._db.find_user_by(email=email).hashed_password.split(b"$")[2]
+
+
+encrypt_password._rounds = 4
+AUTH.register_user(email, password)
+print(cost())
+
+encrypt_password._rounds = 5
+print(AUTH.valid_login(email, password), cost())
+
+
+def busy(password: str) -> bytes:
+    """a pool with no room left"""
+    raise HashingBusy()
+
+
+encrypt_password._rounds = 6
+AUTH._hash = busy
+print(AUTH.valid_login(email, password), cost())
+print(AUTH.valid_login(email, "WrongPwd"), cost())
+del AUTH._hash
+
+AUTH._hashing = HashingPool(depth=0)
+client = app.test_client()
+for path, form in (("/sessions", {"email": email, "password": password}),
+                   ("/users", {"email": "bill@bob.com", "password": "x"})):
+    response = client.post(path, data=form)
+    print(path, response.status_code, response.headers.get("Retry-After"),
+          response.get_json())